@@ -1,8 +1,13 @@
 import json
+import sys
+import signal
+import argparse
+import base64
+import functools
 import numpy as np
-from convert import convert_stats_result, ic_setting_bytes
+from convert import convert_stats_result, convert_stats_results, setting_repo
 from offsetdict import devices
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, make_response
 from flask.json.provider import DefaultJSONProvider
 
 # A custom JSON Provider has been defined because default flask version can't handle int32
@@ -42,14 +47,10 @@ def call_convert():
  py_version = event["py_version"]
  fw_version = event["fw_version"]
 
- settings = event["settings"]
- settings = eval(f'"{settings}"')
- settings = bytearray(bytes(settings, encoding='latin'))
+ settings = field_bytes(event["settings"])
  #print(settings)
 
- data = event["data"]
- data = eval(f'"{data}"')
- data = bytearray(bytes(data, encoding='latin'))
+ data = field_bytes(event["data"])
 #  print(data)
 
 
@@ -66,14 +67,34 @@ def call_convert():
   return "error"
     
 
+# Same as /processdev for many results at once: {"results": [{mac, board_id, py_version, fw_version, settings, data}, ...]}
+# Replies come back in the same order, "error" for results that couldn't be converted
+
+@app.route('/processdev/batch', methods=['POST'])
+def call_convert_batch():
+
+ event = json.loads(request.data)
+ keys = ('mac', 'board_id', 'py_version', 'fw_version')
+
+ try:
+
+  items = [{**{k: result[k] for k in keys}, 'settings': field_bytes(result['settings']), 'data': field_bytes(result['data'])} for result in event['results']]
+  replies = convert_stats_results(items)
+  return jsonify([reply if reply is not None else "error" for reply in replies])
+
+ except Exception as e:
+  print(e)
+  return "error"
+
+
 # This route returns the calibration offset
 
 @app.route('/caloffset/<mac>', methods=['GET'])
 def get_device_by_mac(mac):
  cal_offset = get_device(mac)
  if cal_offset is None:
-  return jsonify(324)
- return jsonify(cal_offset["offset"])
+  return conditional(jsonify(324))
+ return conditional(jsonify(cal_offset["offset"]))
 
     # return jsonify(cal_offset)
 
@@ -85,17 +106,55 @@ def get_device(mac):
 def ic_setting(id,mac):
  
  try:
-    ret = ic_setting_bytes(int(id))
-    # print(ret)
-    return bytes_to_string(bytes(ret))
+    stored = setting_repo.get(int(id))
+    if stored is None:
+        raise KeyError(id)
+    # print(stored.blob)
+    if accepts_binary():
+        response = make_response(stored.blob)
+        response.mimetype = BINARY
+        etag = stored.hash
+    else:
+        response = make_response(bytes_to_string(stored.blob)) # clients from before the binary transport
+        etag = stored.hash + '-text'
+    response.vary.add('Accept')
+    return conditional(response, etag)
  except Exception as e:
     print("Either the MAC or the id is not correct. Please double check")
-    return "error"
+    return "error", 404
 
+def conditional(response, etag=None):
+  """
+  Adds an ETag so clients can revalidate with If-None-Match, and answers 304 when theirs still matches.
+  etag: known version of the body (e.g. the stored setting hash), None hashes the body
+  """
+  if etag is None:
+    response.add_etag()
+  else:
+    response.set_etag(etag)
+  return response.make_conditional(request)
+
+BINARY = 'application/octet-stream'
+
+def accepts_binary():
+  # only when asked for by name with q > 0, legacy clients send */* and expect the string form
+  return any(mimetype == BINARY and quality > 0 for mimetype, quality in request.accept_mimetypes)
+
+def field_bytes(value):
+  """
+  Decodes settings/data sent by apicall, base64 as {'__B64__': ...} or the older \\xNN escaped string.
+  """
+  if isinstance(value, dict):
+      return bytearray(base64.b64decode(value['__B64__']))
+  return bytearray(value.encode('latin-1').decode('unicode_escape').encode('latin-1'))
+
+_ESCAPES = [' ' if byte == 32 else '\\x{:02x}'.format(byte) for byte in range(256)]
+
+@functools.lru_cache(maxsize=64)
 def bytes_to_string(data):
   """
   This function converts bytes data to a string representation
-  without decoding the bytes.
+  without decoding the bytes, for clients that don't accept application/octet-stream.
 
   Args:
       data: The bytes data to be converted.
@@ -103,14 +162,31 @@ def bytes_to_string(data):
   Returns:
       A string representation of the bytes data.
   """
-  result = ""
-  for byte in data:
-      if byte == 32:  # ASCII code for space
-          result += " "
-      else:
-          result += "\\x{:02x}".format(byte)
-  return result
+  return ''.join(map(_ESCAPES.__getitem__, data))
+
+
+def serve_production(host: str, port: int, threads: int):
+  """
+  Serves app with waitress (works on windows too), keep-alive connections and a thread pool instead of the dev server.
+  SIGTERM shuts down like Ctrl+C, so queued telemetry is sent or spooled on the way out (telemetrics atexit).
+  On linux with many cores, gunicorn -c gunicorn.conf.py api:app runs several worker processes instead.
+  """
+  try:
+      import waitress
+  except ImportError:
+      raise SystemExit('pip install waitress to use --server waitress')
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  waitress.serve(app, host=host, port=port, threads=threads, connection_limit=1000, channel_timeout=75)
 
 
 if __name__ == '__main__':
-   app.run(port=5000)
\ No newline at end of file
+   parser = argparse.ArgumentParser()
+   parser.add_argument('--server', choices=['dev', 'waitress'], default='dev')
+   parser.add_argument('--host', default='127.0.0.1')
+   parser.add_argument('--port', type=int, default=5000)
+   parser.add_argument('--threads', type=int, default=16)
+   args = parser.parse_args()
+   if args.server == 'waitress':
+      serve_production(args.host, args.port, args.threads)
+   else:
+      app.run(host=args.host, port=args.port)
\ No newline at end of file
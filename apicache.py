@@ -0,0 +1,85 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+import requests
+from httpclient import HttpClient
+
+try:
+    import cPickle as pickle
+except ImportError:  # Python 3.x
+    import pickle
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str | None
+    fetched_at: float # time.time(), so it means the same after a restart
+    content_type: str | None = None
+
+
+class ResponseCache:
+    '''
+    GET responses that rarely change (calibration offsets, IC settings), kept in memory and in a pickle
+    at path so they survive restarts.
+
+    Within ttl seconds of being fetched a response is served without touching the network. After that it is
+    revalidated with If-None-Match, a 304 keeps the cached body. When the endpoint can't be reached the last
+    known body is served, however old, so a session can start offline.
+    '''
+    def __init__(self, client: HttpClient, path: str, ttl: float) -> None:
+        self.client = client
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, CachedResponse] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as fp:
+                    self._entries = pickle.load(fp)
+            except (pickle.UnpicklingError, EOFError):
+                pass # corrupt cache, start empty
+
+    def _save(self):
+        # caller holds the lock
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(self._entries, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: tuple, path: str, headers: dict | None = None) -> CachedResponse:
+        '''
+        GET path, cached under key, raises when the endpoint can't be reached and nothing is cached
+        or when it answers with an error
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            return entry
+
+        headers = dict(headers or {})
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        try:
+            response = self.client.get(path, headers=headers)
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            print(f'{path} failed ({e}), using the value cached {time.time() - entry.fetched_at:.0f}s ago')
+            return entry
+        if response.status_code == 304 and entry is not None:
+            entry = CachedResponse(entry.body, entry.etag, time.time(), entry.content_type)
+        else:
+            response.raise_for_status()
+            entry = CachedResponse(response.content, response.headers.get('ETag'), time.time(), response.headers.get('Content-Type'))
+
+        with self._lock:
+            self._entries[key] = entry
+            self._save()
+        return entry
+
+    def invalidate(self, key: tuple):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
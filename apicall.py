@@ -1,87 +1,64 @@
 from coms import MODE
 # from convert import convert_stats_result, ic_setting_bytes
 import text
-import requests
 import logging, autologging, uuid
 from io import StringIO
 import atexit
 import time
 import os
+import json
+import base64
+from httpclient import HttpClient
+from apicache import ResponseCache
 _log_stream = StringIO()
 logging.basicConfig(stream=_log_stream, encoding='utf-8', level=autologging.TRACE, format='%(asctime)s\t%(levelname)s\t%(name)s.%(funcName)s\t%(message)s')
-# import base64
-
-# class B64Encoder(json.JSONEncoder):
-#     def default(self, obj):
-#         if isinstance(obj, bytearray):
-#             return {'__B64__': base64.b64encode(obj).decode('ascii')}
-#         return super().default(obj)
-
-def bytes_to_string(data):
-  """
-  This function converts bytes data to a string representation
-  without decoding the bytes.
-
-  Args:
-      data: The bytes data to be converted.
-
-  Returns:
-      A string representation of the bytes data.
-  """
-  result = ""
-  for byte in data:
-      if byte == 32:  # ASCII code for space
-          result += " "
-      else:
-          result += "\\x{:02x}".format(byte)
-  return result
 
-def get_ic_setting(mac: str, board_id: str, py_version: str, fw_version: str, id: int):
+# one pooled keep-alive client for all calls, with timeouts, retries and a circuit breaker (see httpclient.py)
+client = HttpClient(os.environ.get('API_URL', 'http://3.25.191.180'))
+# calibration offsets and IC settings are only fetched again once API_CACHE_TTL seconds old (see apicache.py)
+cache = ResponseCache(client, os.environ.get('API_CACHE_PATH', 'apicache.p'), float(os.environ.get('API_CACHE_TTL', 3600)))
 
-    url = "http://3.25.191.180/ic_setting/" + mac + "/" + str(id)
+BINARY = 'application/octet-stream'
 
-    try:
+def b64_field(data) -> dict:
+    '''
+    bytes as a json value, decoded on the server by api.field_bytes
+    '''
+    return {'__B64__': base64.b64encode(bytes(data)).decode('ascii')}
+
+def legacy_string_to_bytes(data: str) -> bytearray:
+    '''
+    decodes the \\xNN strings older servers send
+    '''
+    return bytearray(data.encode('latin-1').decode('unicode_escape').encode('latin-1'))
 
-        ret = requests.request("GET", url)
-    
-    except:
+def get_ic_setting(mac: str, board_id: str, py_version: str, fw_version: str, id: int):
 
-        try:
-            ret = requests.request("GET", url)
-        except Exception as e:
-            raise ValueError(f'setting id {id} returned none, please ensure a setting id')
+    key = ('ic_setting', mac, id, BINARY)
+    try:
+        ret = cache.get(key, "/ic_setting/" + mac + "/" + str(id), headers={'Accept': BINARY})
+    except Exception as e:
+        raise ValueError(f'setting id {id} returned none, please ensure a setting id') from e
 
     # ret = ic_setting_bytes(id)
-    if ret is "error":
+    if ret.content_type == BINARY:
+        return bytearray(ret.body)
+    if ret.body == b"error": # older servers answer 200 with this, don't keep it
+        cache.invalidate(key)
         raise ValueError(f'setting id {id} returned none, please ensure a setting id')
-    
-    ret_string = eval(f'"{ret}"')
-    ret_byte = bytearray(bytes(ret_string, encoding='latin'))
-
-    return ret
+    return legacy_string_to_bytes(ret.body.decode())
 
 def get_cal_offset(mac: str, board_id: str, py_version: str, fw_version: str) -> int:
     '''
     return value that can fit into uint16
     '''
 
-    url = "http://3.25.191.180/caloffset/" + mac
-
-    try:
-
-        result = requests.request("GET", url)
-    
-    except:
-
-        try:
-            result = requests.request("GET", url)
-        except Exception as e:
-            print(e)
+    result = cache.get(('caloffset', mac), "/caloffset/" + mac).body
 
     # print(type(result.text))
 
 
-    return eval(result.text) # chose based on value that was in rx scan. Eval is used because the server returns string
+    return json.loads(result) # chose based on value that was in rx scan, the server returns it as json
 
 def send_stats_result(mac: str, board_id: str, py_version: str, fw_version: str, settings: bytearray, data: bytearray):
     # TODO backend should save result with these
@@ -95,28 +72,16 @@ def send_stats_result(mac: str, board_id: str, py_version: str, fw_version: str,
     print(text.style(f'py_version: {py_version}', text.STYLE.FG_RED))
     print(text.style(f'fw_version: {fw_version}', text.STYLE.FG_RED))
 
-    url = "http://3.25.191.180/processdev"
-
     myobj = {
 	"mac": mac,
 	"board_id": board_id,
 	"py_version": py_version,
 	"fw_version": fw_version,
-	"settings": bytes_to_string(bytes(settings)),
-	"data": bytes_to_string(bytes(data))
+	"settings": b64_field(settings),
+	"data": b64_field(data)
     }
 
-    try:
-
-        result = requests.post(url, json = myobj)
-    
-    except:
-
-        try:
-
-            result = requests.post(url, json = myobj)
-        except Exception as e:
-            print(e)
+    result = client.post("/processdev", json = myobj)
 
     # result = convert_stats_result(settings, data)
 
@@ -140,6 +105,18 @@ def send_stats_result(mac: str, board_id: str, py_version: str, fw_version: str,
     # return {k:result_dict[k] for k in CUSTOMER_KEYS}
     return result_dict
 
+def send_stats_results(results: list[dict]) -> list[dict | str]:
+    '''
+    uploads many results in one request, each a dict of the send_stats_result arguments
+
+    returns the replies in the same order, "error" for results the server couldn't convert
+    '''
+    payload = {'results': [{**{k: result[k] for k in ('mac', 'board_id', 'py_version', 'fw_version')},
+                            'settings': b64_field(result['settings']),
+                            'data': b64_field(result['data'])} for result in results]}
+    result = client.post("/processdev/batch", json = payload)
+    return json.loads(result.content.decode())
+
 # def send_logs(mac: str, board_id: str, py_version: str, fw_version: str, logs: str):
 def send_logs():
     # TODO backend saving
@@ -0,0 +1,206 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import deque
+
+try:
+    import cPickle as pickle
+except ImportError:  # Python 3.x
+    import pickle
+
+
+class AverageStore:
+    '''
+    Rolling window average of response dicts per mac.
+
+    Windows live in memory with running sums, so an update costs the same however many macs are stored.
+    Every update is appended to an append-only pickle log at path, which is replayed on start up and
+    rewritten as a snapshot once it holds too many superseded records.
+
+    Safe across threads of one process only, use SQLiteAverageStore when several processes serve requests.
+    '''
+    COMPACT_FACTOR = 4 # compact once the log holds this many times the records needed to rebuild the windows
+
+    def __init__(self, path: str, window: int, legacy_path: str | None = None) -> None:
+        self.path = path
+        self.window = window
+        self.windows: dict[str, deque] = {}
+        self.sums: dict[str, dict] = {}
+        self.evictions: dict[str, int] = {}
+        self.log_records = 0
+        self._log = None
+        self._lock = threading.Lock()
+        self._load(legacy_path)
+
+    def _load(self, legacy_path: str | None):
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as fp:
+                while True:
+                    try:
+                        mac, values = pickle.load(fp)
+                    except EOFError:
+                        break
+                    except pickle.UnpicklingError:
+                        break # torn write at the end of the log, keep what was read
+                    self._push(mac, values)
+                    self.log_records += 1
+        elif legacy_path and os.path.exists(legacy_path):
+            # the old data.p store, a pickled {mac: [response dict, ...]}
+            with open(legacy_path, 'rb') as fp:
+                for mac, values_list in pickle.load(fp).items():
+                    for values in values_list:
+                        self._push(mac, values)
+            self.compact()
+
+    def _push(self, mac: str, values: dict):
+        values = {k: float(v) for k, v in values.items()}
+        if mac not in self.windows:
+            self.windows[mac] = deque()
+            self.sums[mac] = dict.fromkeys(values, 0.0)
+            self.evictions[mac] = 0
+        window = self.windows[mac]
+        sums = self.sums[mac]
+        if len(window) >= self.window:
+            for k, v in window.popleft().items():
+                sums[k] -= v
+            self.evictions[mac] += 1
+        window.append(values)
+        for k, v in values.items():
+            sums[k] = sums.get(k, 0.0) + v
+        if self.evictions[mac] >= self.window: # resum now and then so float error can't build up
+            self.sums[mac] = {k: sum(values.get(k, 0.0) for values in window) for k in sums}
+            self.evictions[mac] = 0
+
+    def average(self, mac: str) -> dict:
+        count = len(self.windows[mac])
+        return {k: v / count for k, v in self.sums[mac].items()}
+
+    def add(self, mac: str, values: dict) -> dict:
+        '''
+        adds values to the window of mac and returns the average over the window
+        '''
+        with self._lock:
+            self._push(mac, values)
+            self._append_log([(mac, self.windows[mac][-1])])
+            return self.average(mac)
+
+    def add_many(self, items: list[tuple[str, dict]]) -> list[dict]:
+        '''
+        add for each (mac, values) in order with a single log write, returns the average after each one
+        '''
+        averages = []
+        records = []
+        with self._lock:
+            for mac, values in items:
+                self._push(mac, values)
+                records.append((mac, self.windows[mac][-1]))
+                averages.append(self.average(mac))
+            self._append_log(records)
+        return averages
+
+    def _append_log(self, records: list[tuple[str, dict]]):
+        if self._log is None:
+            self._log = open(self.path, 'ab')
+        for record in records:
+            pickle.dump(record, self._log, protocol=pickle.HIGHEST_PROTOCOL)
+        self._log.flush()
+        self.log_records += len(records)
+        if self.log_records > self.COMPACT_FACTOR * max(1, sum(len(w) for w in self.windows.values())):
+            self.compact()
+
+    def compact(self):
+        '''
+        rewrites the log as a snapshot holding only the current windows
+        '''
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            for mac, window in self.windows.items():
+                for values in window:
+                    pickle.dump((mac, values), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, self.path)
+        self.log_records = sum(len(w) for w in self.windows.values())
+
+
+class SQLiteAverageStore:
+    '''
+    Same interface as AverageStore, backed by a SQLite database in WAL mode so any number of
+    threads and worker processes can share the windows. Each add is one short write transaction
+    (insert, trim the window of that mac, read it back), readers never block writers.
+    '''
+    def __init__(self, path: str, window: int, legacy_path: str | None = None) -> None:
+        self.path = path
+        self.window = window
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS avg_window (id INTEGER PRIMARY KEY AUTOINCREMENT, mac TEXT NOT NULL, response TEXT NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS avg_window_mac ON avg_window (mac, id)')
+        if legacy_path and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, so one per thread
+        if not hasattr(self._local, 'conn'):
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL') # durable enough in WAL mode, avoids an fsync per commit
+            self._local.conn = conn
+        return self._local.conn
+
+    def _transaction(self, func):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+            conn.execute('COMMIT')
+            return result
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import_legacy(self, legacy_path: str):
+        # the old data.p store, a pickled {mac: [response dict, ...]}, imported by the first worker only
+        def import_legacy(conn: sqlite3.Connection):
+            if conn.execute('SELECT 1 FROM avg_window LIMIT 1').fetchone():
+                return
+            with open(legacy_path, 'rb') as fp:
+                response_store = pickle.load(fp)
+            for mac, values_list in response_store.items():
+                for values in values_list[-self.window:]:
+                    conn.execute('INSERT INTO avg_window (mac, response) VALUES (?, ?)', (mac, json.dumps({k: float(v) for k, v in values.items()})))
+        self._transaction(import_legacy)
+
+    def add(self, mac: str, values: dict) -> dict:
+        '''
+        adds values to the window of mac and returns the average over the window
+        '''
+        return self.add_many([(mac, values)])[0]
+
+    def add_many(self, items: list[tuple[str, dict]]) -> list[dict]:
+        '''
+        add for each (mac, values) in order in a single transaction, returns the average after each one
+        '''
+        def add_and_read(conn: sqlite3.Connection):
+            windows = []
+            for mac, values in items:
+                values = {k: float(v) for k, v in values.items()}
+                conn.execute('INSERT INTO avg_window (mac, response) VALUES (?, ?)', (mac, json.dumps(values)))
+                rows = conn.execute('SELECT id, response FROM avg_window WHERE mac = ? ORDER BY id DESC LIMIT ?', (mac, self.window)).fetchall()
+                conn.execute('DELETE FROM avg_window WHERE mac = ? AND id < ?', (mac, rows[-1][0]))
+                windows.append(rows)
+            return windows
+        windows = self._transaction(add_and_read)
+
+        averages = []
+        for rows in windows:
+            sums = {}
+            for _, response in rows:
+                for k, v in json.loads(response).items():
+                    sums[k] = sums.get(k, 0.0) + v
+            averages.append({k: v / len(rows) for k, v in sums.items()})
+        return averages
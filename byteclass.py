@@ -1,56 +1,217 @@
-from typing import Literal, TypeVar, get_origin
+from typing import Annotated, Literal, TypeVar, get_origin
+from dataclasses import dataclass
+import inspect
 import numpy as np
 
+@dataclass(frozen=True)
+class FieldLayout:
+    name: str
+    offset: int
+    size: int
+    dtype: np.dtype # element type, shape is () for scalars
+    shape: tuple[int, ...]
+
+@dataclass(frozen=True)
+class Layout:
+    fields: dict[str, FieldLayout]
+    nbytes: int
+
+def _layout(dtype: np.dtype) -> Layout:
+    fields = {}
+    for var_name in dtype.names:
+        var_dtype, offset = dtype.fields[var_name][:2]
+        fields[var_name] = FieldLayout(
+            name=var_name,
+            offset=offset,
+            size=var_dtype.itemsize,
+            dtype=var_dtype.base,
+            shape=var_dtype.shape,
+        )
+    return Layout(fields=fields, nbytes=dtype.itemsize)
+
+_BYTEORDER_CHAR = {'little': '<', 'big': '>'}
+
+def _unwrap(var_type) -> tuple[type, str | None]:
+    '''
+    Annotated[np.uint16, 'big'] -> (np.uint16, 'big'), lets a single member override the class byteorder
+    '''
+    if get_origin(var_type) is Annotated:
+        byteorder = next((m for m in var_type.__metadata__ if m in _BYTEORDER_CHAR), None)
+        return var_type.__origin__, byteorder
+    return var_type, None
+
+def _field_dtype(var_type, byteorder: Literal['little', 'big']) -> np.dtype:
+    var_type, field_byteorder = _unwrap(var_type)
+    order_char = _BYTEORDER_CHAR[field_byteorder or byteorder]
+    if get_origin(var_type) == np.ndarray:
+        args = var_type.__args__ if hasattr(var_type, '__args__') else []
+        if len(args) != 2:
+            raise TypeError(f'np.ndarray members need a dtype and a fixed length, got {var_type}')
+        return np.dtype((np.dtype(args[0]).newbyteorder(order_char), (args[1],)))
+    return np.dtype(var_type).newbyteorder(order_char)
+
+def _field_coerce(var_type):
+    var_type, _ = _unwrap(var_type)
+    if get_origin(var_type) == np.ndarray:
+        args = var_type.__args__ if hasattr(var_type, '__args__') else []
+        dtype = args[0] if len(args) >= 1 else None
+        length = args[1] if len(args) == 2 else None
+        def coerce(value):
+            value = np.asarray(value, dtype=dtype)
+            if length is not None and len(value) != length:
+                raise BufferError(f'expected length of {length}, got {len(value)}')
+            return value
+        return coerce
+    return var_type
+
+def _native(value):
+    if isinstance(value, np.ndarray):
+        return value.astype(value.dtype.newbyteorder('='))
+    return value
+
 class ByteClass:
     '''
     Expects that all members of the child class have a method equivalent to tobytes() from numpy types.
 
     Currently only supports integer types.
+
+    Each subclass compiles its annotations once into a structured dtype (_dtype),
+    which to_bytes/from_bytes use to pack and unpack the whole object in a single numpy call.
+
+    The wire layout is set per class, independent of the host:
+        class Example(ByteClass, byteorder='big', align=True)
+    byteorder defaults to 'little' and align (C struct padding) to False, both are inherited by subclasses.
+    Single members can override the class byteorder with Annotated[np.uint16, 'big'].
     '''
+    _byteorder: Literal['little', 'big'] = 'little'
+    _align: bool = False
+
+    def __init_subclass__(cls, byteorder: Literal['little', 'big'] | None = None, align: bool | None = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if byteorder is not None:
+            if byteorder not in _BYTEORDER_CHAR:
+                raise ValueError(f'invalid byteorder: {byteorder}')
+            cls._byteorder = byteorder
+        if align is not None:
+            cls._align = align
+        if not inspect.get_annotations(cls) and hasattr(cls, '_dtype') and byteorder is None and align is None: # no new members (e.g. views), keep the parent codec
+            return
+        # members of base classes come first, redefined ones keep their position (same order as dataclasses)
+        annotations = {}
+        for base in reversed(cls.__mro__):
+            if issubclass(base, ByteClass) and base is not ByteClass:
+                annotations.update(inspect.get_annotations(base))
+        cls._annotations = annotations
+        cls._fields = tuple(annotations.keys())
+        cls._coerce = tuple((var_name, _field_coerce(var_type)) for var_name, var_type in annotations.items())
+        cls._dtypes = {
+            order: np.dtype([(var_name, _field_dtype(var_type, order)) for var_name, var_type in annotations.items()], align=cls._align)
+            for order in _BYTEORDER_CHAR
+        }
+        cls._dtype = cls._dtypes[cls._byteorder]
+        cls._layout = _layout(cls._dtype)
+
     def __post_init__(self):
-        for var_name, var_type in self.__annotations__.items():
-            if get_origin(var_type) == np.ndarray:
-                args = var_type.__args__ if hasattr(var_type, '__args__') else []
-                
-                dtype = args[0] if len(args) >= 1 else None
-                length = args[1] if len(args) == 2 else None
-                self.__dict__[var_name] = np.asarray(self.__dict__[var_name], dtype=dtype)
-                if length is not None and len(self.__dict__[var_name]) != length:
-                    raise BufferError(f'expected length of {length}, got {len(self.__dict__[var_name])}')
-            else:
-                self.__dict__[var_name] = var_type(self.__dict__[var_name])
-
-    def to_bytes(self, byteorder: Literal['little', 'big']) -> bytearray:
-        result = bytearray()
-        if byteorder == 'big':
-            raise NotImplementedError('big byteorder not yet supported')
-        for var in self.__dict__.values():
-            result += var.tobytes(order='C') # TODO is this always going to be little endian or will that change on system?
-        return result
+        for var_name, coerce in self._coerce:
+            self.__dict__[var_name] = coerce(self.__dict__[var_name])
+
+    def to_bytes(self, byteorder: Literal['little', 'big'] | None = None) -> bytearray:
+        '''
+        byteorder: overrides the class byteorder (members annotated with their own byteorder keep it), None uses the class layout
+        '''
+        dtype = self._dtypes[byteorder] if byteorder else self._dtype
+        record = np.zeros(1, dtype=dtype) # zeroed so align padding is deterministic
+        record[0] = tuple(self.__dict__[var_name] for var_name in self._fields)
+        return bytearray(record.tobytes())
     
     def nbytes(self) -> int:
-        result = 0
-        for var in self.__dict__.values():
-            result += var.nbytes
-        return result
+        return self._layout.nbytes
+
+def layout(byte_class: type[ByteClass] | ByteClass) -> Layout:
+    return byte_class._layout
 
-def nbytes(byte_class: type[ByteClass] | ByteClass):
-    result = 0
-    for var_type in byte_class.__annotations__.values():
-        result += np.dtype(var_type).itemsize
-    return result
+def nbytes(byte_class: type[ByteClass] | ByteClass) -> int:
+    return byte_class._layout.nbytes
 
 T = TypeVar('T')
-def from_bytes(byte_class: type[T], data: bytearray) -> T:
-    if nbytes(byte_class) != len(data):
-        raise ValueError()
-    init_args = {}
-    data_i = 0
-    for var_name, var_type in byte_class.__annotations__.items():
-        var_size = np.dtype(var_type).itemsize
-        init_args[var_name] = np.frombuffer(data[data_i:data_i+var_size], dtype=var_type)[0]
-        data_i += var_size
-    return byte_class(**init_args)
+def from_bytes(byte_class: type[T], data: bytearray, byteorder: Literal['little', 'big'] | None = None) -> T:
+    if byte_class._layout.nbytes != len(data):
+        raise ValueError(f'expected {byte_class._layout.nbytes} bytes, got {len(data)}')
+    dtype = byte_class._dtypes[byteorder] if byteorder else byte_class._dtype
+    record = np.frombuffer(data, dtype=dtype, count=1)[0]
+    # record fields are already the annotated numpy types, so skip __init__/__post_init__ coercion
+    obj = byte_class.__new__(byte_class)
+    for var_name in byte_class._fields:
+        value = record[var_name]
+        obj.__dict__[var_name] = _native(value)
+    return obj
+
+def _view_property(var_name: str) -> property:
+    def fget(self):
+        return self._record[var_name][0]
+    def fset(self, value):
+        self._record[var_name][0] = value
+    return property(fget, fset)
+
+def _view_eq(self, other):
+    if not isinstance(other, self._byte_class):
+        return NotImplemented
+    return all(np.array_equal(getattr(self, var_name), getattr(other, var_name)) for var_name in self._fields)
+
+def _view_to_bytes(self, byteorder: Literal['little', 'big'] | None = None) -> bytearray:
+    if byteorder and self._dtypes[byteorder] != self._dtype:
+        return bytearray(self._record.astype(self._dtypes[byteorder]).tobytes())
+    return bytearray(self._record.tobytes())
+
+def _view_class(byte_class: type[ByteClass]) -> type:
+    if '_view_class' not in byte_class.__dict__:
+        namespace = {var_name: _view_property(var_name) for var_name in byte_class._fields}
+        namespace['to_bytes'] = _view_to_bytes
+        namespace['__eq__'] = _view_eq
+        namespace['_byte_class'] = byte_class
+        byte_class._view_class = type(f'{byte_class.__name__}View', (byte_class,), namespace)
+    return byte_class._view_class
+
+def view(byte_class: type[T], data: bytearray | memoryview) -> T:
+    '''
+    zero copy alternative to from_bytes, the returned object is a subclass of byte_class whose members
+    are read from and written to data on access. data must be writable (e.g. bytearray) to set members.
+
+    array members are returned as views, so view(ICSetting, data).uni_rx_scan_regs[0x07B-0x003] = 0x1F patches data in place
+
+    a view compares equal to any view or instance of byte_class with the same member values
+    '''
+    if byte_class._layout.nbytes != len(data):
+        raise ValueError(f'expected {byte_class._layout.nbytes} bytes, got {len(data)}')
+    view_class = _view_class(byte_class)
+    obj = view_class.__new__(view_class)
+    obj.__dict__['_record'] = np.frombuffer(data, dtype=byte_class._dtype, count=1)
+    return obj
+
+def from_bytes_batch(byte_class: type[ByteClass], data: bytes | bytearray | memoryview) -> np.ndarray:
+    '''
+    decodes a contiguous buffer of N records into a structured array (one row per record, no per record objects)
+
+    columns are views, e.g. from_bytes_batch(StatsRXResult, data)['bit_errors']
+    '''
+    itemsize = byte_class._layout.nbytes
+    if len(data) % itemsize:
+        raise ValueError(f'buffer of {len(data)} bytes is not a multiple of {itemsize} byte records')
+    return np.frombuffer(data, dtype=byte_class._dtype)
+
+def to_bytes_batch(byte_class: type[ByteClass], records: np.ndarray | dict[str, np.ndarray]) -> bytearray:
+    '''
+    reverse of from_bytes_batch, records is a structured array or a dict of equal length columns
+    '''
+    if isinstance(records, np.ndarray):
+        return bytearray(records.astype(byte_class._dtype, copy=False).tobytes())
+    lengths = {len(records[var_name]) for var_name in byte_class._fields}
+    if len(lengths) != 1:
+        raise ValueError(f'columns have different lengths: {lengths}')
+    result = np.zeros(lengths.pop(), dtype=byte_class._dtype)
+    for var_name in byte_class._fields:
+        result[var_name] = records[var_name]
+    return bytearray(result.tobytes())
 
 if __name__ == '__main__':
     from dataclasses import dataclass
@@ -70,3 +231,13 @@ if __name__ == '__main__':
 
     ex_obj2 = from_bytes(ExampleClass, ex_obj_bytes)
     print(ex_obj2)
+
+    ex_view = view(ExampleClass, ex_obj_bytes)
+    ex_view.var2 = 127
+    print(ex_view)
+    print(ex_obj_bytes)
+
+    ex_batch = from_bytes_batch(ExampleClass, ex_obj_bytes * 3)
+    print(ex_batch)
+    print(ex_batch['var2'])
+    print(to_bytes_batch(ExampleClass, ex_batch) == ex_obj_bytes * 3)
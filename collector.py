@@ -0,0 +1,105 @@
+'''
+Local stand-in for the stats collector that telemetrics pushes to, for trying the senders without the cloud.
+
+    python collector.py --port 5001
+    TELEMETRY_URL=http://127.0.0.1:5001/stats/pushjsonv2 python api.py
+
+Accepts PUT with plain or gzip (Content-Encoding) JSON bodies, single documents ({"data": {...}})
+or batches ({"data": [...]} with ?batch=true), raw documents are flagged with ?isRaw=true.
+Raw uploads can also be rawframe streams (application/octet-stream, ?format=bin), plain or chunked.
+'''
+import gzip
+import json
+import threading
+import rawframe
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class Collector:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.results: list[dict] = []
+        self.raw: list[dict] = []
+        self.requests = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                query = parse_qs(urlparse(self.path).query)
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = self._read_chunked()
+                else:
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                size = len(body)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                try:
+                    if self.headers.get('Content-Type') == rawframe.CONTENT_TYPE:
+                        documents = rawframe.decode_stream(body)
+                    else:
+                        documents = json.loads(body)['data']
+                        if query.get('batch') != ['true']:
+                            documents = [documents]
+                except (ValueError, KeyError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                with collector._lock:
+                    collector.requests += 1
+                    collector.bytes_received += size
+                    (collector.raw if query.get('isRaw') == ['true'] else collector.results).extend(documents)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.end_headers()
+                self.wfile.write(f'ok {len(documents)}'.encode())
+
+            def _read_chunked(self) -> bytes:
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if not size:
+                        self.rfile.readline() # trailing CRLF
+                        return b''.join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self.server.server_port}/stats/pushjsonv2'
+        self._thread = None
+
+    def start(self) -> 'Collector':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'requests': self.requests, 'bytes': self.bytes_received, 'results': len(self.results), 'raw': len(self.raw)}
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+
+    collector = Collector(args.host, args.port).start()
+    print(f'collecting on {collector.url}')
+    try:
+        while True:
+            time.sleep(5)
+            print(collector.stats())
+    except KeyboardInterrupt:
+        collector.stop()
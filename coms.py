@@ -66,6 +66,32 @@ class FieldModeSerial(byteclass.ByteClass):
 @dataclass
 class FieldModeLED(byteclass.ByteClass):
     dummy: np.uint8
+SCAN_REGS = 613
+CACHE_REGS = 56
+@dataclass
+class ICSetting(byteclass.ByteClass):
+    id: np.uint32 
+    bitrate: np.uint32 
+    clk_tx: np.uint32 
+    clk_carrier: np.uint32 
+    clk_irx: np.uint32 
+    uni_tx_scan_regs: np.ndarray[np.uint8,613]
+    uni_tx_cache_regs: np.ndarray[np.uint8,56]
+    uni_rx_scan_regs: np.ndarray[np.uint8,613]
+    uni_rx_cache_regs: np.ndarray[np.uint8,56]
+    sched_scan_regs: np.ndarray[np.uint8,613]
+    sched_cache_regs: np.ndarray[np.uint8,56]
+@dataclass
+class StatsRXResult(byteclass.ByteClass):
+    bytes_per_packet: np.uint32
+    acq_duration_us: np.uint32
+    packets_missed: np.uint32
+    packets_received: np.uint32
+    packets_with_errors: np.uint32
+    bit_count: np.uint32
+    bit_errors: np.uint32
+    rssi_base_avg: np.int16
+    rssi_avg: np.int16
 FIELD_TYPE: dict[FIELD_NAME, byteclass.ByteClass] = {
     FIELD_NAME.VERSION: FieldVersion,
     FIELD_NAME.BOARDID: FieldBoardID,
@@ -76,6 +102,7 @@ FIELD_TYPE: dict[FIELD_NAME, byteclass.ByteClass] = {
     FIELD_NAME.MODE_SERIAL: FieldModeSerial,
     FIELD_NAME.MODE_LED_TX: FieldModeLED,
     FIELD_NAME.MODE_LED_RX: FieldModeLED,
+    FIELD_NAME.ICSETTING: ICSetting,
 }
 class FIELD_DIR(IntEnum):
     RD = 0
@@ -89,6 +116,38 @@ class FIELD_STATUS(IntEnum):
     ERROR_DATA = auto()
     TOTAL = auto()
 
+@dataclass(frozen=True)
+class FieldSchema:
+    '''
+    framing of one field, precomputed by compile_field_schema
+
+    request:  [CMD_TYPE.FIELD, name, dir] (+ size bytes of data for WR)
+    response: [CMD_TYPE.RESP_FIELD, name, dir, FIELD_STATUS] (+ size bytes of data for RD)
+    '''
+    name: FIELD_NAME
+    type: type[byteclass.ByteClass]
+    size: int
+    cmd: dict[FIELD_DIR, bytes]
+    resp_ok: dict[FIELD_DIR, bytes]
+
+    def decode(self, data: bytearray) -> byteclass.ByteClass:
+        return byteclass.from_bytes(self.type, data)
+
+def compile_field_schema(field_types: dict[FIELD_NAME, type[byteclass.ByteClass]]) -> dict[FIELD_NAME, FieldSchema]:
+    schema = {}
+    for name, field_type in field_types.items():
+        dirs = [FIELD_DIR.RD, FIELD_DIR.WR]
+        schema[name] = FieldSchema(
+            name=name,
+            type=field_type,
+            size=byteclass.nbytes(field_type),
+            cmd={dir: bytes([CMD_TYPE.FIELD, name, dir]) for dir in dirs},
+            resp_ok={dir: bytes([CMD_TYPE.RESP_FIELD, name, dir, FIELD_STATUS.SUCCESS]) for dir in dirs},
+        )
+    return schema
+
+FIELD_SCHEMA = compile_field_schema(FIELD_TYPE)
+
 #################### DATA ####################
 class DATA_STATUS(IntEnum):
     SUCCESS = 0
@@ -100,6 +159,8 @@ class DATA_STATUS(IntEnum):
     ERROR_NOT_READY = auto()
     TOTAL = auto()
 
+DATA_ENABLE_CMD = {enable: bytes([CMD_TYPE.DATA_ENABLE, int(enable)]) for enable in (False, True)}
+
 #################### MODE ####################
 class MODE(IntEnum):
     NONE = 0
@@ -110,6 +171,34 @@ class MODE(IntEnum):
     LED_RX = auto()
     TOTAL = auto()
 
+@dataclass(frozen=True)
+class DataSchema:
+    '''
+    framing of DATA for one mode, precomputed by compile_data_schema
+
+    frame:    header ([CMD_TYPE.DATA, mode]) + [size] + size bytes of data, both directions
+    response: [CMD_TYPE.RESP_DATA, mode, DATA_STATUS] to a data_wr
+    '''
+    mode: MODE
+    header: bytes
+    resp_ok: bytes
+
+def compile_data_schema(modes) -> dict[MODE, DataSchema]:
+    return {
+        mode: DataSchema(
+            mode=mode,
+            header=bytes([CMD_TYPE.DATA, mode]),
+            resp_ok=bytes([CMD_TYPE.RESP_DATA, mode, DATA_STATUS.SUCCESS]),
+        )
+        for mode in modes
+    }
+
+DATA_SCHEMA = compile_data_schema(mode for mode in MODE if mode != MODE.TOTAL)
+# header of a received DATA frame -> mode, so data_rd decodes it with one lookup
+DATA_HEADER_MODE = {schema.header: mode for mode, schema in DATA_SCHEMA.items()}
+
+MODE_RESET_CMD = FIELD_SCHEMA[FIELD_NAME.MODE].cmd[FIELD_DIR.WR] + bytes([MODE.NONE])
+
 class IC_STATUS(IntEnum):
     NONE = 0
     ERROR_INVALID = auto()
@@ -1,25 +1,37 @@
 import byteclass
+import regmap
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import text
 import json
-from coms import FieldModeStatsRX
+from coms import FieldModeStatsRX, ICSetting, StatsRXResult
 from typing import Literal
 import rssi
-import functools
-from collections import Counter
 from offsetdict import mac_avg, CUSTOMER_KEYS
-from telemetrics import push_json, push_json_raw
-import concurrent.futures
-
-try:
-    import cPickle as pickle
-except ImportError:  # Python 3.x
-    import pickle
-
-executor = concurrent.futures.ThreadPoolExecutor()
+from telemetrics import push_json, push_raw, telemetry
+import base64
+from avgstore import AverageStore, SQLiteAverageStore
+from settingstore import SettingRepository
+import os
+import threading
 
 avg_length = 5
+_avg_store = None
+_avg_store_lock = threading.Lock()
+
+def avg_store() -> AverageStore | SQLiteAverageStore:
+    '''
+    opened on the first averaged response, so importing convert doesn't touch data.db/data.p
+    '''
+    global _avg_store
+    with _avg_store_lock:
+        if _avg_store is None:
+            # sqlite is shared safely between server workers, AVG_STORE=memory keeps the windows in this process only
+            if os.environ.get('AVG_STORE', 'sqlite') == 'memory':
+                _avg_store = AverageStore('data.log', avg_length, legacy_path='data.p')
+            else:
+                _avg_store = SQLiteAverageStore('data.db', avg_length, legacy_path='data.p')
+        return _avg_store
 
 # @dataclass
 # class ICSettings:
@@ -39,22 +51,6 @@ avg_length = 5
 # }
 
 
-SCAN_REGS = 613
-CACHE_REGS = 56
-@dataclass
-class ICSetting(byteclass.ByteClass):
-    id: np.uint32 
-    bitrate: np.uint32 
-    clk_tx: np.uint32 
-    clk_carrier: np.uint32 
-    clk_irx: np.uint32 
-    uni_tx_scan_regs: np.ndarray[np.uint8,613]
-    uni_tx_cache_regs: np.ndarray[np.uint8,56]
-    uni_rx_scan_regs: np.ndarray[np.uint8,613]
-    uni_rx_cache_regs: np.ndarray[np.uint8,56]
-    sched_scan_regs: np.ndarray[np.uint8,613]
-    sched_cache_regs: np.ndarray[np.uint8,56]
-
 SETTINGS:dict[int,ICSetting] = {
     0x12345678: ICSetting(
         id = 0x12345678, # TODO temp
@@ -75,18 +71,64 @@ SETTINGS:dict[int,ICSetting] = {
 }
 
 
-
 @dataclass
-class StatsRXResult(byteclass.ByteClass):
-    bytes_per_packet: np.uint32
-    acq_duration_us: np.uint32
-    packets_missed: np.uint32
-    packets_received: np.uint32
-    packets_with_errors: np.uint32
-    bit_count: np.uint32
-    bit_errors: np.uint32
-    rssi_base_avg: np.int16
-    rssi_avg: np.int16
+class SettingParams:
+    '''
+    values derived from an ICSetting, worked out once when the setting is registered instead of for every result
+    '''
+    bitrate: int
+    carrier_hz: int
+    lna_mode: Literal['SE', 'Diff']
+    gain: int
+    _lut: np.ndarray | None = field(default=None, repr=False)
+    _lut_version: int = field(default=-1, repr=False)
+
+    @classmethod
+    def from_setting(cls, ic_setting: ICSetting) -> 'SettingParams':
+        fields = regmap.QS126.extract(ic_setting)
+        lna_mode = 'SE' if fields['rx_lna_se'][0] else 'Diff'
+        return cls(bitrate=int(ic_setting.bitrate), carrier_hz=int(ic_setting.clk_carrier), lna_mode=lna_mode, gain=int(fields['rx_gain'][0]))
+
+    def lut(self) -> np.ndarray | None:
+        # looked up again only when the calibration csv was reloaded
+        version = rssi.calibrations.version()
+        if version != self._lut_version:
+            self._lut = rssi.calibration_lut(self.bitrate, self.carrier_hz, self.lna_mode, self.gain)
+            self._lut_version = version
+        return self._lut
+
+    def convert_uv(self, rssi_value: int) -> float | None:
+        lut = self.lut()
+        if lut is None:
+            return None
+        return float(lut[min(max(int(rssi_value), 0), len(lut)-1)])
+
+    def convert_uv_array(self, rssi_values: np.ndarray) -> np.ndarray:
+        lut = self.lut()
+        if lut is None:
+            return np.full(len(rssi_values), np.nan)
+        return lut[np.clip(rssi_values, 0, len(lut)-1)]
+
+SETTING_PARAMS: dict[int, SettingParams] = {}
+# more settings can be dropped into IC_SETTINGS_DIR as json/bin files, see settingstore.py
+setting_repo = SettingRepository(ICSetting, os.environ.get('IC_SETTINGS_DIR', 'ic_settings'))
+
+def _index_setting(ic_setting: ICSetting):
+    SETTINGS[int(ic_setting.id)] = ic_setting
+    SETTING_PARAMS[int(ic_setting.id)] = SettingParams.from_setting(ic_setting)
+
+def register_setting(ic_setting: ICSetting):
+    '''
+    adds or replaces a setting, use this rather than writing SETTINGS directly so SETTING_PARAMS and setting_repo follow
+    '''
+    setting_repo.add(ic_setting)
+    _index_setting(ic_setting)
+
+for ic_setting in list(SETTINGS.values()):
+    register_setting(ic_setting)
+for stored in setting_repo.load():
+    _index_setting(stored.setting)
+
 
 
 # class StatsRXReply:
@@ -119,43 +161,95 @@ class StatsRXResult(byteclass.ByteClass):
 #         self.RSSIBaseV = rssi_base_uv/1e6
 #         self.RSSISignalV = rssi_signal_uv/1e6
 
+RSSI_INVALID = 32767
+
 class StatsRXReply:
     def __init__(self, settings: FieldModeStatsRX, result: StatsRXResult) -> None:
-        ic_setting = SETTINGS[settings.ic_setting_id]
-
-        # some terrible bit fields reading from the scan registers
-        lna_mode = 'SE' if ic_setting.uni_rx_scan_regs[0x091-0x003] & (1 << 5) else 'Diff' 
-        gain = ic_setting.uni_rx_scan_regs[0x07B-0x003] & 0b11111
-        
-        rssi_conversion = functools.partial(rssi.convert_uv,
-                                            bitrate_hz=int(ic_setting.bitrate),
-                                            carrier_hz=int(ic_setting.clk_carrier),
-                                            lna_mode=lna_mode,
-                                            gain=gain)
-        rssi_base_uv = rssi_conversion(rssi=result.rssi_base_avg)
-        rssi_signal_uv = rssi_conversion(rssi=result.rssi_avg)
+        params = SETTING_PARAMS[settings.ic_setting_id]
+        rssi_base_uv = params.convert_uv(result.rssi_base_avg)
+        rssi_signal_uv = params.convert_uv(result.rssi_avg)
+
+        # python ints, so sums and differences of the uint32 counters can't wrap around
+        received = int(result.packets_received)
+        missed = int(result.packets_missed)
+        with_errors = int(result.packets_with_errors)
 
         self.SettingID = settings.ic_setting_id
-        self.Bitrate = ic_setting.bitrate
+        self.Bitrate = params.bitrate
         self.BytesPerPacket = result.bytes_per_packet
         self.Duration = result.acq_duration_us / 1e6
 
         # PER was PwE
         # PMDR was PER+PwE
         self.BER = result.bit_errors / result.bit_count if result.bit_count else 0.5
-        self.PER = result.packets_with_errors / result.packets_received if result.packets_received else 1.0
-        self.PMDR = (result.packets_with_errors + result.packets_missed) / (result.packets_missed + result.packets_received) if result.packets_received else 1.0
-        self.Latency = self.Duration / result.packets_received if result.packets_received else None # TODO proper calculation with spi delays...
-        self.LinkMargin = rssi.link_margin(rssi_base_uv, rssi_signal_uv) if result.rssi_base_avg != 32767 and result.rssi_avg != 32767 else 0.0
-        self.Throughput = (result.packets_received-result.packets_with_errors)*self.BytesPerPacket*8/self.Duration if self.Duration else 0.0
-        self.RSSIBaseV = rssi_base_uv/1e6
-        self.RSSISignalV = rssi_signal_uv/1e6
+        self.PER = with_errors / received if received else 1.0
+        self.PMDR = (with_errors + missed) / (missed + received) if received else 1.0
+        self.Latency = self.Duration / received if received else None # TODO proper calculation with spi delays...
+        if result.rssi_base_avg == RSSI_INVALID or result.rssi_avg == RSSI_INVALID:
+            self.LinkMargin = 0.0
+        elif rssi_base_uv is None or rssi_signal_uv is None:
+            self.LinkMargin = None # no calibration for this setting
+        else:
+            self.LinkMargin = rssi.link_margin(rssi_base_uv, rssi_signal_uv)
+        # a corrupt result can report more packets with errors than received
+        self.Throughput = max(received - with_errors, 0)*int(self.BytesPerPacket)*8/self.Duration if self.Duration else 0.0
+        self.RSSIBaseV = rssi_base_uv/1e6 if rssi_base_uv is not None else None
+        self.RSSISignalV = rssi_signal_uv/1e6 if rssi_signal_uv is not None else None
+
+
+def _safe_div(num: np.ndarray, den: np.ndarray, default: float) -> np.ndarray:
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.full(np.broadcast(num, den).shape, default), where=den != 0)
+
+def stats_rx_replies(settings: np.ndarray, results: np.ndarray) -> dict[str, np.ndarray]:
+    '''
+    batch version of StatsRXReply over structured arrays of FieldModeStatsRX settings and StatsRXResult results
+    (e.g. from byteclass.from_bytes_batch or stats_results_from_raw), returns one column per StatsRXReply member
+
+    same rules as StatsRXReply, except values that would be None (Latency, missing calibration) are nan
+    '''
+    if len(settings) != len(results):
+        raise ValueError(f'{len(settings)} settings for {len(results)} results')
+    setting_ids = settings['ic_setting_id']
+    bytes_per_packet = results['bytes_per_packet'].astype(np.int64)
+    received = results['packets_received'].astype(np.int64)
+    missed = results['packets_missed'].astype(np.int64)
+    with_errors = results['packets_with_errors'].astype(np.int64)
+    duration = results['acq_duration_us'] / 1e6
+
+    bitrate = np.zeros(len(results), dtype=np.uint32)
+    rssi_base_uv = np.full(len(results), np.nan)
+    rssi_signal_uv = np.full(len(results), np.nan)
+    for setting_id in np.unique(setting_ids):
+        params = SETTING_PARAMS[int(setting_id)]
+        sel = setting_ids == setting_id
+        bitrate[sel] = params.bitrate
+        rssi_base_uv[sel] = params.convert_uv_array(results['rssi_base_avg'][sel])
+        rssi_signal_uv[sel] = params.convert_uv_array(results['rssi_avg'][sel])
+
+    rssi_valid = (results['rssi_base_avg'] != RSSI_INVALID) & (results['rssi_avg'] != RSSI_INVALID)
+    link_margin = np.where(rssi_valid, rssi.link_margin_array(rssi_base_uv, rssi_signal_uv), 0.0)
+
+    return {
+        'SettingID': setting_ids,
+        'Bitrate': bitrate,
+        'BytesPerPacket': results['bytes_per_packet'],
+        'Duration': duration,
+        'BER': _safe_div(results['bit_errors'], results['bit_count'], 0.5),
+        'PER': _safe_div(with_errors, received, 1.0),
+        'PMDR': np.where(received != 0, _safe_div(with_errors + missed, missed + received, 1.0), 1.0),
+        'Latency': _safe_div(duration, received, np.nan),
+        'LinkMargin': link_margin,
+        'Throughput': _safe_div(np.maximum(received - with_errors, 0) * bytes_per_packet * 8, duration, 0.0),
+        'RSSIBaseV': rssi_base_uv / 1e6,
+        'RSSISignalV': rssi_signal_uv / 1e6,
+    }
 
 
 
 def convert_stats_result(mac: str, board_id: str, py_version: str, fw_version: str, settings_b: bytearray, data: bytearray) -> dict:
-    future = executor.submit(
-        push_json_raw({'mac': mac, 'board_id': board_id, 'py_version': py_version, 'fw_version': fw_version,'settings': settings_b, 'data': data}))
+    telemetry.submit(push_raw, {'mac': mac, 'board_id': board_id, 'py_version': py_version, 'fw_version': fw_version,'settings': settings_b, 'data': data})
 
     settings = byteclass.from_bytes(FieldModeStatsRX, settings_b)
     result = byteclass.from_bytes(StatsRXResult, data)
@@ -180,57 +274,7 @@ def convert_stats_result(mac: str, board_id: str, py_version: str, fw_version: s
 # The following code is to make sure we give certain customers averaged value 
 
     if mac in mac_avg and None not in response_dict.values(): #We skip None values because it's hard to average when there are none values
-
-        # Define response store or load, if it already exists
-        try:
-
-            with open('data.p', 'rb') as fp:
-                response_store = pickle.load(fp)
-        except:
-            response_store = {}
-
-        # If the mac has already been tested
-
-        if mac in response_store.keys():
-            # print("stored data",len(response_store[mac]))
-            if len(response_store[mac])>avg_length-1:
-                response_store[mac].pop(0)  # Make sure the stored value is always equal to the avg length of averaging window
-                # print(type(update_mac_response),type(response_store[mac]))
-            # else :
-            update_mac_response = response_store[mac]
-
-            # Add the new response to the list of data being averaged over
-            
-            update_mac_response.append(response_dict) 
-            response_store[mac]=update_mac_response
-            # Use counter to sum over the list of dicts
-
-            Counter_sum = Counter()
-            for x in range(0,len(update_mac_response)):
-                Counter_sum.update(Counter(update_mac_response[x]))
-            # print("counter_sum",dict(Counter_sum))
-            return_dict = {key: value / len(update_mac_response) for key, value in Counter_sum.items()} # This is the average of the values
-            # avg_mac_response = dict(Counter_sum)
-        else:
-
-            # Create new response store if it doesn't already exists for the mac
-
-            update_mac_response = []
-            update_mac_response.append(response_dict)
-            response_store.update({mac:update_mac_response})
-            return_dict = response_dict
-
-        # convert_stats_result.store = response_store
-
-        # print("trying to write")
-        # print(type(response_store))
-        # with open('data.json', 'w') as outfile:
-        #     json.dump(response_store, outfile)
-        
-        with open('data.p', 'wb') as fp:
-            pickle.dump(response_store, fp, protocol=pickle.HIGHEST_PROTOCOL)
-
-            ## avg over the update_mac_response to create the response
+        return_dict = avg_store().add(mac, response_dict) # average over the last avg_length responses of this mac
     else:
         return_dict = response_dict
 
@@ -242,14 +286,79 @@ def convert_stats_result(mac: str, board_id: str, py_version: str, fw_version: s
 
     print('response sent')
 
-    # future = executor.submit(push_json(response))
-
-    future = executor.submit(push_json(response_dict))
+    telemetry.submit(push_json, response_dict)
 
 
     return return_dict
     # return {k:return_dict[k] for k in CUSTOMER_KEYS}
 
 
-def ic_setting_bytes(id:int) -> bytearray | None:
-    return SETTINGS[id].to_bytes('little') if id in SETTINGS.keys() else None
+def convert_stats_results(items: list[dict]) -> list[dict | None]:
+    '''
+    batch version of convert_stats_result, each item holds mac, board_id, py_version, fw_version, settings and data
+
+    all items are converted in one stats_rx_replies pass and averaged with one avg_store update, values that
+    would be None stay None. Items that can't be converted (wrong sizes, unknown setting id) give None.
+    '''
+    settings_size = byteclass.nbytes(FieldModeStatsRX)
+    result_size = byteclass.nbytes(StatsRXResult)
+    for item in items:
+        telemetry.submit(push_raw, {k: item[k] for k in ('mac', 'board_id', 'py_version', 'fw_version', 'settings', 'data')})
+
+    sized = [i for i, item in enumerate(items) if len(item['settings']) == settings_size and len(item['data']) == result_size]
+    settings = byteclass.from_bytes_batch(FieldModeStatsRX, b''.join(bytes(items[i]['settings']) for i in sized))
+    results = byteclass.from_bytes_batch(StatsRXResult, b''.join(bytes(items[i]['data']) for i in sized))
+    known = np.isin(settings['ic_setting_id'], list(SETTING_PARAMS.keys()))
+    rows = [i for i, ok in zip(sized, known) if ok]
+    columns = stats_rx_replies(settings[known], results[known])
+
+    names = list(columns.keys())
+    responses = [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+    for response in responses:
+        for k, v in response.items():
+            if v != v: # nan back to None
+                response[k] = None
+
+    averaged = [(n, items[i]['mac'], response) for n, (i, response) in enumerate(zip(rows, responses)) if items[i]['mac'] in mac_avg and None not in response.values()]
+    averages = avg_store().add_many([(mac, response) for _, mac, response in averaged]) if averaged else []
+    return_dicts = [dict(response) for response in responses]
+    for (n, _, _), average in zip(averaged, averages):
+        return_dicts[n] = average
+
+    replies = [None] * len(items)
+    for i, response, return_dict in zip(rows, responses, return_dicts):
+        input = {k: items[i][k] for k in ('mac', 'board_id', 'py_version', 'fw_version')}
+        response.update(input)
+        return_dict.update(input)
+        telemetry.submit(push_json, response)
+        replies[i] = return_dict
+    return replies
+
+
+def _raw_bytes(value) -> bytes:
+    if isinstance(value, dict) and '__B64__' in value:
+        return base64.b64decode(value['__B64__'])
+    return bytes(value)
+
+def stats_results_from_raw(raw_payloads: list[dict]) -> tuple[np.ndarray, np.ndarray, list[int]]:
+    '''
+    batch decode of push_json_raw payloads (the dict passed as json_data, settings/data as bytes or {'__B64__': ...})
+
+    returns structured arrays (FieldModeStatsRX settings, StatsRXResult results) and the index of the payload
+    behind each row. Payloads with wrong-sized settings or data are skipped, so they can't shift the rows after them.
+    '''
+    settings_size = byteclass.nbytes(FieldModeStatsRX)
+    result_size = byteclass.nbytes(StatsRXResult)
+    settings_b = [_raw_bytes(payload['settings']) for payload in raw_payloads]
+    data_b = [_raw_bytes(payload['data']) for payload in raw_payloads]
+    sized = [i for i in range(len(raw_payloads)) if len(settings_b[i]) == settings_size and len(data_b[i]) == result_size]
+    if len(sized) != len(raw_payloads):
+        print(f'skipped {len(raw_payloads) - len(sized)} raw payloads with wrong-sized settings or data')
+    settings = byteclass.from_bytes_batch(FieldModeStatsRX, b''.join(settings_b[i] for i in sized))
+    results = byteclass.from_bytes_batch(StatsRXResult, b''.join(data_b[i] for i in sized))
+    return settings, results, sized
+
+
+def ic_setting_bytes(id:int) -> bytes | None:
+    stored = setting_repo.get(id) # serialised when the setting was added
+    return stored.blob if stored is not None else None
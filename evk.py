@@ -16,8 +16,8 @@ class IxanaEVK:
         self.ser = ble.BLESerial(mac)
         self.ser.open()
         self.mode_reset()
-        self.version = byteclass.from_bytes(FieldVersion, self.field_rd(FIELD_NAME.VERSION))
-        self.boardid = byteclass.from_bytes(FieldBoardID, self.field_rd(FIELD_NAME.BOARDID))
+        self.version = FIELD_SCHEMA[FIELD_NAME.VERSION].decode(self.field_rd(FIELD_NAME.VERSION))
+        self.boardid = FIELD_SCHEMA[FIELD_NAME.BOARDID].decode(self.field_rd(FIELD_NAME.BOARDID))
         self.ic_setting_id = None
 
     def _write(self, data: bytearray | list[int]) -> None:
@@ -41,39 +41,35 @@ class IxanaEVK:
             return data
         raise TypeError(f'{type(data)}')
 
+    @staticmethod
+    def _field_schema(name: FIELD_NAME) -> FieldSchema:
+        if name not in FIELD_SCHEMA:
+            raise ValueError(f"invalid FIELD_NAME: {name}")
+        return FIELD_SCHEMA[name]
+
+    def _field_response(self, schema: FieldSchema, dir: FIELD_DIR, op: str) -> None:
+        response = self._read(4)
+        if response == schema.resp_ok[dir]:
+            return
+        if response[:3] != schema.resp_ok[dir][:3]:
+            raise ValueError(f"{op} error: {list(response)}")
+        raise ValueError(f'{op} error: {repr(FIELD_STATUS(response[3]))}')
+
     def field_rd(self, name: FIELD_NAME) -> bytearray:
         # logger.debug(f'{self.field_rd.__name__}({locals().items()})')
-        if name > FIELD_NAME.TOTAL:
-            raise ValueError(f"invalid FIELD_NAME: {name}")
-        
-        cmd = bytearray([CMD_TYPE.FIELD.value, name.value, FIELD_DIR.RD.value])
-        self._write(cmd)
-
-        response = list(self._read(4))
-        if response[:3] != [CMD_TYPE.RESP_FIELD.value, name.value, FIELD_DIR.RD.value]:
-            raise ValueError(f"field rd error: {response}")
-        if response[3] != FIELD_STATUS.SUCCESS.value:
-            raise ValueError(f'field rd error: {repr(FIELD_STATUS(response[3]))}')
-        
-        return self._read(byteclass.nbytes(FIELD_TYPE[name]))
+        schema = self._field_schema(name)
+        self._write(schema.cmd[FIELD_DIR.RD])
+        self._field_response(schema, FIELD_DIR.RD, 'field rd')
+        return self._read(schema.size)
 
     def field_wr(self, name: FIELD_NAME, data) -> bytearray:
-        if name > FIELD_NAME.TOTAL:
-            raise ValueError(f"invalid FIELD_NAME: {name}")
-        
+        schema = self._field_schema(name)
         data_list = self._field_data_format(data)
-        field_size = 2027 if name == FIELD_NAME.ICSETTING else byteclass.nbytes(FIELD_TYPE[name])
-        if len(data_list) != field_size:
-            raise ValueError(f"invalid data size: {len(data_list)} != {field_size}")
+        if len(data_list) != schema.size:
+            raise ValueError(f"invalid data size: {len(data_list)} != {schema.size}")
         
-        cmd = bytearray([CMD_TYPE.FIELD.value, name.value, FIELD_DIR.WR.value]) + data_list
-        self._write(cmd)
-
-        response = list(self._read(4))
-        if response[:3] != [CMD_TYPE.RESP_FIELD.value, name.value, FIELD_DIR.WR.value]:
-            raise ValueError(f"field wr error: {response}")
-        if response[3] != FIELD_STATUS.SUCCESS.value:
-            raise ValueError(f'field wr error: {repr(FIELD_STATUS(response[3]))}')
+        self._write(schema.cmd[FIELD_DIR.WR] + data_list)
+        self._field_response(schema, FIELD_DIR.WR, 'field wr')
 
 
     def field_wrrd(self, name: FIELD_NAME, data):
@@ -86,26 +82,29 @@ class IxanaEVK:
     #################### DATA ####################
 
     def data_enable(self, enable: bool):
-        cmd = [CMD_TYPE.DATA_ENABLE, int(enable)]
-        self._write(bytearray(cmd))
+        self._write(DATA_ENABLE_CMD[bool(enable)])
 
     def rd8(self, signed=False) -> int:
         return int.from_bytes(self._read(1), byteorder='little', signed=signed)
 
     def data_rd(self) -> tuple[MODE, bytearray]:
-        cmd_type = CMD_TYPE(self.rd8())
-        if cmd_type != CMD_TYPE.DATA:
-            raise ValueError(f'{cmd_type}')
-
-        mode = MODE(self.rd8())
-        size = self.rd8()
-        return (mode, self._read(size))
+        header = self._read(3) # [CMD_TYPE.DATA, mode, size]
+        mode = DATA_HEADER_MODE.get(bytes(header[:2]))
+        if mode is None:
+            raise ValueError(f"data rd error: {list(header)}")
+        return (mode, self._read(header[2]))
 
     def data_wr(self, mode: MODE, data):
-        cmd = bytearray([CMD_TYPE.DATA, mode, len(data)]) + self._field_data_format(data)
-        self._write(cmd)
-
-        response = list(self._read(3))
+        schema = DATA_SCHEMA.get(mode)
+        data = self._field_data_format(data)
+        # a mode without a schema is still sent, the EVK answers ERROR_MODE and that is reported below
+        header = schema.header if schema is not None else bytes([CMD_TYPE.DATA, mode])
+        self._write(header + bytes([len(data)]) + data)
+
+        response = self._read(3)
+        if schema is not None and response == schema.resp_ok:
+            return
+        response = list(response)
         if response[0] != CMD_TYPE.RESP_DATA:
             raise ValueError(f"data wr error: {response}")
         if response[1] != mode:
@@ -130,7 +129,7 @@ class IxanaEVK:
             raise ValueError(repr(mode))
 
     def mode_reset(self):
-        self._write(bytearray([CMD_TYPE.FIELD, FIELD_NAME.MODE, FIELD_DIR.WR, MODE.NONE])) # stop any operations
+        self._write(MODE_RESET_CMD) # stop any operations
         sleep(0.5) # pause in case of remaining actions
         self.data_enable(False)
         self.ser.reset_input_buffer() # clear any remaining data
@@ -140,7 +139,7 @@ class IxanaEVK:
         self.mode_wrrd(MODE.NONE)
 
         if field is not None:
-            field_bytes = field_data.to_bytes('little') if issubclass(type(field_data), ByteClass) else field_data
+            field_bytes = field_data.to_bytes() if issubclass(type(field_data), ByteClass) else field_data
             self.field_wrrd(field, field_bytes)
 
         self.mode_wrrd(mode)
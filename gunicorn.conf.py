@@ -0,0 +1,27 @@
+'''
+Production serving of api.py (linux), routes are the same as with the Flask dev server:
+
+    gunicorn -c gunicorn.conf.py api:app
+
+Every worker process imports api itself (no preload), so each gets its own sqlite connections and telemetry
+threads after the fork. Averaging windows are shared through data.db (AVG_STORE=sqlite, the default).
+Each worker spools undelivered telemetry into its own directory under TELEMETRY_SPOOL_DIR, segments of
+workers that died are picked up by one of the others.
+'''
+import os
+import multiprocessing
+
+bind = os.environ.get('API_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('API_THREADS', 4))
+keepalive = 75 # longer than typical load balancer idle timeouts, so they don't hit closed connections
+graceful_timeout = 30
+preload_app = False
+accesslog = None
+
+
+def worker_exit(server, worker):
+    # send (or spool) what is still queued before the worker goes away
+    from telemetrics import telemetry
+    telemetry.close()
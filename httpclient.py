@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+
+class CircuitOpen(requests.ConnectionError):
+    '''
+    raised without touching the network while the circuit breaker is open
+    '''
+
+
+class HttpClient:
+    '''
+    Shared keep-alive session for calls to the cloud endpoint.
+
+    Every request has a (connect, read) timeout. Connection errors, timeouts and 5xx responses are retried up
+    to retries times with full-jitter exponential backoff, other responses are returned as they are.
+    Methods that aren't idempotent (POST /processdev adds to the averaging and telemetry) are only retried
+    when the connection could not be made, so the server can't have seen the request.
+    After failure_threshold requests in a row have failed, the circuit opens and requests fail straight
+    away with CircuitOpen for reset_after seconds, then one request is let through to probe the endpoint.
+    '''
+    RETRY_STATUS = (500, 502, 503, 504)
+    IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, base_url: str, timeout: tuple[float, float] = (3.05, 30.0), retries: int = 3,
+                 backoff_min: float = 0.2, backoff_max: float = 5.0,
+                 failure_threshold: int = 5, reset_after: float = 30.0, pool_size: int = 10) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def _check_circuit(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_after:
+                raise CircuitOpen(f'{self.base_url} failed {self._failures} times in a row, not retrying for {self.reset_after}s')
+            self._opened_at = time.monotonic() # half open, let this request probe, the rest keep failing fast
+
+    def _record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+
+    @staticmethod
+    def _not_sent(error: Exception) -> bool:
+        '''
+        True when the connection was never made, so the request didn't reach the server
+        '''
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        self._check_circuit()
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.base_url + path
+        idempotent = method.upper() in self.IDEMPOTENT
+        backoff = self.backoff_min
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in self.RETRY_STATUS:
+                    self._record(True)
+                    return response
+                error = requests.HTTPError(f'{response.status_code} from {url}', response=response)
+                if not idempotent:
+                    break
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                if not idempotent and not self._not_sent(e):
+                    break
+            if attempt < self.retries:
+                time.sleep(random.uniform(0, backoff)) # full jitter
+                backoff = min(backoff * 2, self.backoff_max)
+        self._record(False)
+        raise error
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
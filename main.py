@@ -74,7 +74,7 @@ def example_mode_stats_rx(evk: IxanaEVK, save_dir: str, data_size: int, duration
         print(f'\n----------{i}: {repr(result_type)}----------')
         reply = apicall.send_stats_result(
             **{k:str(v) for k,v in common_dict.items()},
-            settings=field.to_bytes('little'),
+            settings=field.to_bytes(),
             data=result_bytes
         )
         csv_dict = common_dict.copy()
@@ -85,6 +85,127 @@ def example_mode_stats_rx(evk: IxanaEVK, save_dir: str, data_size: int, duration
 
     evk.mode_reset()
 
+import math
+import byteclass
+
+def wilson_interval(k: int, n: int, z: float = 1.96) -> tuple[float, float]:
+    '''
+    confidence interval on a k/n proportion, stays sensible when k is 0 or n
+    '''
+    if not n:
+        return (0.0, 1.0)
+    p = k / n
+    denom = 1 + z**2/n
+    center = (p + z**2/(2*n)) / denom
+    half = z * math.sqrt(p*(1-p)/n + z**2/(4*n**2)) / denom
+    return (max(0.0, center-half), min(1.0, center+half))
+
+def _interval_converged(k: int, n: int, precision: float, floor: float) -> bool:
+    lo, hi = wilson_interval(k, n)
+    if hi <= floor: # confidently better than we care to resolve
+        return True
+    return k > 0 and (hi-lo)/2 <= precision * (k/n)
+
+class StatsRXAccumulator:
+    '''
+    sums StatsRXResult counters across runs so BER/PER can be estimated over the whole acquisition
+    '''
+    COUNTERS = ['acq_duration_us', 'packets_missed', 'packets_received', 'packets_with_errors', 'bit_count', 'bit_errors']
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.totals = {k: 0 for k in self.COUNTERS}
+
+    def add(self, result: StatsRXResult):
+        self.runs += 1
+        for k in self.COUNTERS:
+            self.totals[k] += int(getattr(result, k))
+
+    def summary(self) -> dict:
+        t = self.totals
+        ber_lo, ber_hi = wilson_interval(t['bit_errors'], t['bit_count'])
+        per_lo, per_hi = wilson_interval(t['packets_with_errors'], t['packets_received'])
+        return {
+            'Runs': self.runs,
+            'Duration': t['acq_duration_us'] / 1e6,
+            'BER': t['bit_errors'] / t['bit_count'] if t['bit_count'] else 0.5,
+            'BERLow': ber_lo,
+            'BERHigh': ber_hi,
+            'PER': t['packets_with_errors'] / t['packets_received'] if t['packets_received'] else 1.0,
+            'PERLow': per_lo,
+            'PERHigh': per_hi,
+        }
+
+    def converged(self, precision: float, ber_floor: float, per_floor: float) -> bool:
+        t = self.totals
+        if not t['packets_received']:
+            return True # no link, BER is pinned at 0.5 and more samples will not change that
+        return _interval_converged(t['bit_errors'], t['bit_count'], precision, ber_floor) and \
+            _interval_converged(t['packets_with_errors'], t['packets_received'], precision, per_floor)
+
+def example_mode_stats_rx_adaptive(evk: IxanaEVK, save_dir: str, data_size: int, duration: float, max_time: float, precision: float,
+                                   ber_floor: float = 1e-4, per_floor: float = 1e-2):
+    """
+    save_dir: directory to save the result file
+    data_size: number of bytes to expect in each packet (match with tx)
+    duration: time of each acquisition (seconds)
+    max_time: time budget for all acquisitions (seconds)
+    precision: target 95 percent interval half width on BER and PER, relative to the estimate (e.g. 0.1)
+    ber_floor: stop once the BER upper bound is below this, an error free link needs about 4/ber_floor bits
+    per_floor: stop once the PER upper bound is below this, an error free link needs about 4/per_floor packets
+    """
+    print('----------MODE STATS RX ADAPTIVE----------')
+    MIN_RUNS = 2
+
+    output_file = ModeStatsRXFile(save_dir)
+    common_dict = {
+        'mac': evk.ser.mac_address,
+        'board_id': evk.boardid,
+        'py_version': evk.PYVERSION,
+        'fw_version': evk.version,
+    }
+
+    field = FieldModeStatsRX(
+        ic_setting_id=evk.ic_setting_id,
+        data_size=data_size,
+        duration_us=round(duration * 1e6),
+        cal_offset=apicall.get_cal_offset(**common_dict)
+    )
+    evk.mode_start(MODE.STATS_RX, FIELD_NAME.MODE_STATS_RX, field)
+
+    accum = StatsRXAccumulator()
+    start = time.monotonic()
+    while True:
+        evk.data_wr(MODE.STATS_RX, bytearray())
+        sleep(duration)
+        result_type, result_bytes = evk.data_rd()
+        accum.add(byteclass.from_bytes(StatsRXResult, result_bytes))
+
+        print(f'\n----------{accum.runs-1}: {repr(result_type)}----------')
+        reply = apicall.send_stats_result(
+            **{k:str(v) for k,v in common_dict.items()},
+            settings=field.to_bytes(),
+            data=result_bytes
+        )
+        csv_dict = common_dict.copy()
+        csv_dict.update(reply)
+        output_file.save_row(csv_dict)
+        for k,v in reply.items():
+            print(f'{k}: {v}')
+
+        if accum.runs >= MIN_RUNS and accum.converged(precision, ber_floor, per_floor):
+            print(text.style('converged', text.STYLE.FG_GREEN))
+            break
+        if time.monotonic() - start + duration > max_time:
+            print(text.style('time budget reached', text.STYLE.FG_YELLOW))
+            break
+
+    evk.mode_reset()
+
+    print('\n----------ACCUMULATED----------')
+    for k,v in accum.summary().items():
+        print(f'{k}: {v}')
+
 #################### EXAMPLE: MODE_SERIAL ####################
 import threading
 ser_lock = threading.Lock()
@@ -209,7 +330,7 @@ def example_mode_led_tx(evk: IxanaEVK, colors: list[RGB], interval: float):
     while True:
         for color in colors:
             print(f'\t{color}')
-            evk.data_wr(MODE.LED_TX, color.to_bytes('little'))
+            evk.data_wr(MODE.LED_TX, color.to_bytes())
             sleep(interval)
 
 def example_mode_led_rx(evk: IxanaEVK):
@@ -271,6 +392,7 @@ def arg_example_mode_led_tx(evk: IxanaEVK, interval: float):
 MODE_FUNCS = {
     MODE.STATS_TX.name: example_mode_stats_tx,
     MODE.STATS_RX.name: example_mode_stats_rx,
+    MODE.STATS_RX.name+'_ADAPTIVE': example_mode_stats_rx_adaptive,
     MODE.SERIAL.name+'_BLE_TX': example_mode_serial_ble_tx,
     MODE.SERIAL.name+'_BLE_RX': example_mode_serial_ble_rx,
     MODE.SERIAL.name+'_BLE_TXRX_HUB': example_mode_serial_ble_txrx_hub,
@@ -307,8 +429,13 @@ if __name__ == "__main__":
 
         relevant_args = inspect.getfullargspec(func).annotations
         relevant_args.pop('evk')
+        defaults = inspect.signature(func).parameters
         for arg_name, arg_type in relevant_args.items():
-            subparser.add_argument(arg_name, type=arg_type, help=arg_helps[arg_name])
+            default = defaults[arg_name].default
+            if default is inspect.Parameter.empty:
+                subparser.add_argument(arg_name, type=arg_type, help=arg_helps[arg_name])
+            else: # arguments with a default are optional flags
+                subparser.add_argument(f'--{arg_name}', type=arg_type, default=default, help=f'{arg_helps[arg_name]} (default {default})')
 
     args = parser.parse_args()
     mac = args.mac if args.mac else devices[args.dev]
@@ -0,0 +1,72 @@
+'''
+Binary framing for raw STATS uploads (the push_json_raw payload), instead of JSON with base64 bytearrays.
+
+stream:  MAGIC, then any number of records
+record:  <I length of the rest of the record>
+         mac, board_id, py_version, fw_version  each <B length> + utf-8
+         settings, data                         each <H length> + bytes
+'''
+import struct
+from typing import Iterable, Iterator
+
+MAGIC = b'QSRAW\x01'
+CONTENT_TYPE = 'application/octet-stream'
+
+_TEXT_KEYS = ('mac', 'board_id', 'py_version', 'fw_version')
+_BYTES_KEYS = ('settings', 'data')
+_LENGTH = struct.Struct('<I')
+
+
+def encode_record(json_data: dict) -> bytes:
+    parts = []
+    for key in _TEXT_KEYS:
+        text = str(json_data[key]).encode()
+        parts.append(struct.pack('<B', len(text)) + text)
+    for key in _BYTES_KEYS:
+        value = bytes(json_data[key])
+        parts.append(struct.pack('<H', len(value)) + value)
+    body = b''.join(parts)
+    return _LENGTH.pack(len(body)) + body
+
+
+def encode_stream(json_data_list: Iterable[dict]) -> Iterator[bytes]:
+    '''
+    yields the stream piece by piece, suitable as a chunked upload body
+    '''
+    yield MAGIC
+    for json_data in json_data_list:
+        yield encode_record(json_data)
+
+
+def decode_record(body: bytes | memoryview) -> dict:
+    result = {}
+    i = 0
+    for key in _TEXT_KEYS:
+        length = body[i]
+        result[key] = bytes(body[i+1:i+1+length]).decode()
+        i += 1 + length
+    for key in _BYTES_KEYS:
+        length, = struct.unpack_from('<H', body, i)
+        result[key] = bytes(body[i+2:i+2+length])
+        i += 2 + length
+    if i != len(body):
+        raise ValueError(f'record length {len(body)} does not match its contents ({i})')
+    return result
+
+
+def decode_stream(stream: bytes) -> list[dict]:
+    view = memoryview(stream)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError('not a raw frame stream')
+    records = []
+    i = len(MAGIC)
+    while i < len(view):
+        if i + _LENGTH.size > len(view):
+            raise ValueError('truncated record header')
+        length, = _LENGTH.unpack_from(view, i)
+        i += _LENGTH.size
+        if i + length > len(view):
+            raise ValueError('truncated record')
+        records.append(decode_record(view[i:i+length]))
+        i += length
+    return records
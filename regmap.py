@@ -0,0 +1,162 @@
+'''
+Named bit fields in the ICSetting register arrays, instead of magic offsets like uni_rx_scan_regs[0x091-0x003] & (1 << 5).
+
+A RegisterMap compiles its fields once into index/shift/mask tables per register array, so extracting,
+inserting, diffing or validating runs as a few numpy operations over any number of settings at once.
+Settings can be a single ICSetting, or a structured array of them (byteclass.from_bytes_batch(ICSetting, ...)).
+'''
+from dataclasses import dataclass
+from typing import Literal
+import numpy as np
+
+# address of element 0 of each register array, scan registers start at 0x003
+BANK_BASE = {
+    'uni_tx_scan_regs': 0x003,
+    'uni_tx_cache_regs': 0x000,
+    'uni_rx_scan_regs': 0x003,
+    'uni_rx_cache_regs': 0x000,
+    'sched_scan_regs': 0x003,
+    'sched_cache_regs': 0x000,
+}
+
+@dataclass(frozen=True)
+class RegField:
+    '''
+    bits msb..lsb (inclusive) of the register at address, fields wider than a byte continue into the
+    following registers (little endian)
+
+    values: allowed values, checked by RegisterMap.validate (None allows anything)
+    '''
+    name: str
+    bank: str
+    address: int
+    msb: int
+    lsb: int | None = None
+    access: Literal['rw', 'ro'] = 'rw'
+    values: tuple[int, ...] | None = None
+
+    def __post_init__(self):
+        if self.lsb is None:
+            object.__setattr__(self, 'lsb', self.msb) # single bit
+        if self.bank not in BANK_BASE:
+            raise ValueError(f'{self.name}: unknown register array {self.bank}')
+        if self.address < BANK_BASE[self.bank]:
+            raise ValueError(f'{self.name}: address 0x{self.address:03X} is below the start of {self.bank}')
+        if not 0 <= self.lsb <= self.msb < 32:
+            raise ValueError(f'{self.name}: bad bit range {self.msb}:{self.lsb}')
+
+    @property
+    def index(self) -> int:
+        return self.address - BANK_BASE[self.bank]
+
+    @property
+    def width(self) -> int:
+        return self.msb - self.lsb + 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.msb // 8 + 1
+
+
+@dataclass(frozen=True)
+class _BankPlan:
+    names: tuple[str, ...]
+    index: np.ndarray # (fields, bytes) register index of every byte of every field
+    used: np.ndarray  # (fields, bytes) 0 for padding bytes of fields narrower than the widest one
+    shift: np.ndarray # (fields, bytes) bit position of each byte in the field word
+    lsb: np.ndarray
+    mask: np.ndarray
+
+def _bank(settings, bank: str) -> np.ndarray:
+    if isinstance(settings, np.ndarray):
+        return np.atleast_2d(settings[bank])
+    return np.atleast_2d(np.asarray(getattr(settings, bank), dtype=np.uint8))
+
+class RegisterMap:
+    def __init__(self, fields: list[RegField]) -> None:
+        self.fields = {field.name: field for field in fields}
+        if len(self.fields) != len(fields):
+            raise ValueError('duplicate field names')
+        self._plans: dict[str, _BankPlan] = {}
+        for bank in BANK_BASE:
+            bank_fields = [field for field in fields if field.bank == bank]
+            if not bank_fields:
+                continue
+            width = max(field.nbytes for field in bank_fields)
+            byte = np.arange(width)
+            self._plans[bank] = _BankPlan(
+                names=tuple(field.name for field in bank_fields),
+                index=np.array([field.index + np.minimum(byte, field.nbytes-1) for field in bank_fields]),
+                used=np.array([byte < field.nbytes for field in bank_fields], dtype=np.uint64),
+                shift=np.broadcast_to((8 * byte).astype(np.uint64), (len(bank_fields), width)),
+                lsb=np.array([field.lsb for field in bank_fields], dtype=np.uint64),
+                mask=np.array([(1 << field.width) - 1 for field in bank_fields], dtype=np.uint64),
+            )
+
+    def extract(self, settings) -> dict[str, np.ndarray]:
+        '''
+        value of every field, one array per field with one element per setting
+        '''
+        values = {}
+        for bank, plan in self._plans.items():
+            regs = _bank(settings, bank).astype(np.uint64)
+            words = ((regs[:, plan.index] * plan.used) << plan.shift).sum(axis=-1, dtype=np.uint64) # (settings, fields)
+            fields = (words >> plan.lsb) & plan.mask
+            for i, name in enumerate(plan.names):
+                values[name] = fields[:, i]
+        return values
+
+    def insert(self, settings, values: dict[str, int | np.ndarray]):
+        '''
+        writes field values into settings in place, a value can be one per setting or the same for all
+        '''
+        for name, value in values.items():
+            field = self.fields[name]
+            if field.access == 'ro':
+                raise PermissionError(f'{name} is read only')
+            regs = _bank(settings, field.bank)
+            index = field.index + np.arange(field.nbytes)
+            shift = (8 * np.arange(field.nbytes)).astype(np.uint64)
+            mask = np.uint64(((1 << field.width) - 1) << field.lsb)
+            value = np.asarray(value, dtype=np.uint64)
+            if np.any(value >> np.uint64(field.width)):
+                raise ValueError(f'{name} does not fit in {field.width} bits')
+            word = (regs[:, index].astype(np.uint64) << shift).sum(axis=-1, dtype=np.uint64)
+            word = (word & ~mask) | (value << np.uint64(field.lsb))
+            regs[:, index] = ((word[:, None] >> shift) & np.uint64(0xFF)).astype(np.uint8)
+            if not isinstance(settings, np.ndarray): # structured arrays were written through the view
+                setattr(settings, field.bank, regs[0])
+
+    def diff(self, a, b) -> dict[str, np.ndarray]:
+        '''
+        fields that differ between a and b (row by row, or one against many), with a mask of the rows that differ
+        '''
+        values_a = self.extract(a)
+        values_b = self.extract(b)
+        changed = {}
+        for name in self.fields:
+            mask = values_a[name] != values_b[name]
+            if mask.any():
+                changed[name] = mask
+        return changed
+
+    def validate(self, settings) -> dict[str, np.ndarray]:
+        '''
+        fields holding a value outside their allowed values, with a mask of the offending settings
+        '''
+        values = self.extract(settings)
+        invalid = {}
+        for name, field in self.fields.items():
+            if field.values is None:
+                continue
+            mask = ~np.isin(values[name], field.values)
+            if mask.any():
+                invalid[name] = mask
+        return invalid
+
+
+# fields in use so far, add more as they are needed
+QS126 = RegisterMap([
+    RegField('rx_lna_se', 'uni_rx_scan_regs', 0x091, 5), # 1 single ended, 0 differential
+    RegField('rx_gain', 'uni_rx_scan_regs', 0x07B, 4, 0),
+])
@@ -1,48 +1,83 @@
 from typing import Literal
+import os
 if __name__ == '__main__':
-    from cals import cal_pieces
     from generate import Calibration
+    from registry import CalibrationRegistry, Fallback
 else:
-    from .cals import cal_pieces
     from .generate import Calibration
+    from .registry import CalibrationRegistry, Fallback
 
 from math import log10
+import numpy as np
 
-def convert_uv(bitrate_hz: float, carrier_hz: float, lna_mode: Literal['SE', 'Diff'], gain: int, rssi: int):
-    cal = Calibration(bitrate_hz,carrier_hz,lna_mode,gain)
-    if cal not in cal_pieces.keys():
+# calibrations are read from RSSI2uV_QS126.csv (calibrations.add_path for more), cals.py is no longer used at runtime
+calibrations = CalibrationRegistry()
+# RSSI_CAL_FALLBACK=nearest/interp converts gains missing from the table instead of returning None
+FALLBACK: Fallback = os.environ.get('RSSI_CAL_FALLBACK') or None
+
+def _calibration(bitrate_hz, carrier_hz, lna_mode, gain) -> Calibration:
+    return Calibration(int(bitrate_hz), float(carrier_hz), str(lna_mode), int(gain))
+
+def calibration_lut(bitrate_hz: float, carrier_hz: float, lna_mode: Literal['SE', 'Diff'], gain: int, fallback: Fallback = FALLBACK) -> np.ndarray | None:
+    '''
+    uV for every rssi in the clamped domain [0, end of the last piece), built on first use of a calibration
+
+    lut[np.clip(rssi, 0, len(lut)-1)] converts an array of readings at once
+    '''
+    return calibrations.lut(_calibration(bitrate_hz, carrier_hz, lna_mode, gain), fallback)
+
+def convert_uv(bitrate_hz: float, carrier_hz: float, lna_mode: Literal['SE', 'Diff'], gain: int, rssi: int, fallback: Fallback = FALLBACK):
+    lut = calibration_lut(bitrate_hz, carrier_hz, lna_mode, gain, fallback)
+    if lut is None:
         return None
 
     rssi_clamped = max(int(rssi), 0) # minimum value of 0
-    rssi_clamped = min(rssi_clamped, cal_pieces[cal][-1].end-1) # cap to the max of the last piece
-
-    if rssi_clamped < cal_pieces[cal][0].start: # if rssi is below the start of the first piece, use the first piece
-        piece_sel = cal_pieces[cal][0]
-    else:
-        for piece in cal_pieces[cal]:
-            if rssi_clamped >= piece.start and rssi_clamped < piece.end:
-                piece_sel = piece
-                break
-    
-    result = 0.0
-    for i, coef in enumerate(piece_sel.coef):
-        result += coef*rssi_clamped**i
-
-    result = max(10, result) # minimum value of 10uV
+    rssi_clamped = min(rssi_clamped, len(lut)-1) # cap to the max of the last piece
 
-    return result
+    return float(lut[rssi_clamped])
 
 def link_margin(baseline_uv: float, signal_uv: float):
     if baseline_uv > 0.0 and signal_uv > 0.0:
         return 20 * log10(signal_uv/baseline_uv)
     return None
 
+def convert_uv_array(bitrate_hz, carrier_hz, lna_mode, gain, rssi, fallback: Fallback = FALLBACK) -> np.ndarray:
+    '''
+    array version of convert_uv, all arguments broadcast together so each reading can have its own calibration
+
+    readings are truncated to ints and looked up in the same lut as convert_uv, so results are identical,
+    readings without a calibration are nan (None in convert_uv)
+    '''
+    bitrate_hz, carrier_hz, lna_mode, gain, rssi = np.broadcast_arrays(bitrate_hz, carrier_hz, lna_mode, gain, rssi)
+    rssi = rssi.astype(np.int64) # truncates like int()
+    result = np.full(rssi.shape, np.nan)
+
+    keys = np.rec.fromarrays([bitrate_hz.ravel(), carrier_hz.ravel(), lna_mode.ravel(), gain.ravel()])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(rssi.shape)
+    for i, key in enumerate(unique):
+        lut = calibrations.lut(_calibration(*key), fallback)
+        if lut is not None:
+            sel = inverse == i
+            result[sel] = lut[np.clip(rssi[sel], 0, len(lut)-1)]
+    return result
+
+def link_margin_array(baseline_uv, signal_uv) -> np.ndarray:
+    '''
+    array version of link_margin in dB, nan where link_margin returns None
+    '''
+    baseline_uv = np.asarray(baseline_uv, dtype=np.float64)
+    signal_uv = np.asarray(signal_uv, dtype=np.float64)
+    valid = (baseline_uv > 0.0) & (signal_uv > 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(valid, 20 * np.log10(signal_uv / baseline_uv), np.nan)
+
 def main():
     from functools import partial
     import matplotlib.pyplot as plt
 
     
-    for key in cal_pieces.keys():
+    for key in calibrations.calibrations():
         conversion = partial(convert_uv,
             bitrate_hz=key.bitrate,
             carrier_hz=key.carrier,
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from typing import Literal
+import numpy as np
+if __package__:
+    from .generate import Calibration, CalPiece, read_csv
+else:
+    from generate import Calibration, CalPiece, read_csv
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'RSSI2uV_QS126.csv')
+
+Fallback = Literal['nearest', 'interp'] | None
+
+def evaluate(pieces: list[CalPiece], rssi_clamped: int) -> float:
+    if rssi_clamped < pieces[0].start: # if rssi is below the start of the first piece, use the first piece
+        piece_sel = pieces[0]
+    else:
+        for piece in pieces:
+            if rssi_clamped >= piece.start and rssi_clamped < piece.end:
+                piece_sel = piece
+                break
+
+    result = 0.0
+    for i, coef in enumerate(piece_sel.coef):
+        result += coef*rssi_clamped**i
+
+    return max(10, result) # minimum value of 10uV
+
+class CalibrationRegistry:
+    '''
+    Calibrations read from RSSI2uV csv files (same format as RSSI2uV_QS126.csv) at first use,
+    indexed by (bitrate, carrier, lna_mode) -> gains. Later files override earlier ones.
+
+    Files are checked for changes at most every reload_interval seconds and reloaded when
+    modified, so new calibrations need no regeneration of cals.py or restart.
+
+    Lookups with a fallback cover gains missing from the table:
+        'nearest': the calibrated gain closest to the requested one
+        'interp':  linear interpolation in gain between the two calibrated gains around it
+                   (nearest when the gain is outside the calibrated range)
+    '''
+    def __init__(self, paths: list[str] | None = None, reload_interval: float = 5.0) -> None:
+        self.paths = list(paths) if paths is not None else [DEFAULT_PATH]
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._mtimes: dict[str, float] = {}
+        self._checked = None
+        self._version = 0
+        self._pieces: dict[Calibration, list[CalPiece]] = {}
+        self._gains: dict[tuple, list[int]] = {}
+        self._luts: dict[tuple, np.ndarray | None] = {}
+        self._arrays: dict[Calibration, tuple[np.ndarray, np.ndarray, int]] = {}
+
+    def add_path(self, path: str):
+        with self._lock:
+            self.paths.append(path)
+            self.reload()
+
+    def reload(self):
+        with self._lock:
+            pieces = {}
+            mtimes = {}
+            for path in self.paths:
+                mtimes[path] = os.path.getmtime(path)
+                pieces.update(read_csv(path))
+            gains = {}
+            for cal in pieces:
+                gains.setdefault((cal.bitrate, cal.carrier, cal.lna_mode), []).append(cal.gain)
+            self._pieces = pieces
+            self._gains = {k: sorted(v) for k, v in gains.items()}
+            self._mtimes = mtimes
+            self._luts = {}
+            self._arrays = {}
+            self._checked = time.monotonic()
+            self._version += 1
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            try:
+                if self._checked is None or any(os.path.getmtime(path) != self._mtimes.get(path) for path in self.paths):
+                    self.reload()
+            except Exception as e: # reload only swaps the tables in once a whole file set has been read
+                if self._checked is None:
+                    raise # nothing loaded yet to fall back on
+                # csv removed or half written while being replaced, keep serving the tables loaded before
+                print(f'calibration reload failed, keeping the last loaded tables: {e!r}')
+            self._checked = now
+
+    def version(self) -> int:
+        '''
+        bumped on every reload, for callers holding on to a lut
+        '''
+        self._maybe_reload()
+        return self._version
+
+    def calibrations(self) -> list[Calibration]:
+        self._maybe_reload()
+        return list(self._pieces.keys())
+
+    def pieces(self, cal: Calibration) -> list[CalPiece] | None:
+        self._maybe_reload()
+        return self._pieces.get(cal)
+
+    def arrays(self, cal: Calibration) -> tuple[np.ndarray, np.ndarray, int] | None:
+        '''
+        piece starts, coefficients (one row per piece, zero padded to the highest order) and the end of the last piece
+        '''
+        self._maybe_reload()
+        if cal not in self._arrays:
+            pieces = self._pieces.get(cal)
+            if pieces is None:
+                return None
+            starts = np.array([piece.start for piece in pieces])
+            coefs = np.zeros((len(pieces), max(len(piece.coef) for piece in pieces)))
+            for i, piece in enumerate(pieces):
+                coefs[i, :len(piece.coef)] = piece.coef
+            self._arrays[cal] = (starts, coefs, pieces[-1].end)
+        return self._arrays[cal]
+
+    def resolve(self, cal: Calibration, fallback: Fallback = None) -> list[tuple[float, Calibration]]:
+        '''
+        calibrations and weights to combine for cal, empty when nothing matches
+        '''
+        self._maybe_reload()
+        if cal in self._pieces:
+            return [(1.0, cal)]
+        gains = self._gains.get((cal.bitrate, cal.carrier, cal.lna_mode))
+        if fallback is None or not gains:
+            return []
+        def with_gain(gain):
+            return Calibration(cal.bitrate, cal.carrier, cal.lna_mode, gain)
+        i = int(np.searchsorted(gains, cal.gain))
+        if fallback == 'interp' and 0 < i < len(gains):
+            lo, hi = gains[i-1], gains[i]
+            w = (cal.gain - lo) / (hi - lo)
+            return [(1.0 - w, with_gain(lo)), (w, with_gain(hi))]
+        nearest = min(gains, key=lambda gain: (abs(gain - cal.gain), gain))
+        return [(1.0, with_gain(nearest))]
+
+    def lut(self, cal: Calibration, fallback: Fallback = None) -> np.ndarray | None:
+        '''
+        uV for every rssi in the clamped domain [0, end of the last piece), built on first use
+        '''
+        self._maybe_reload()
+        key = (cal, fallback)
+        if key not in self._luts:
+            resolved = self.resolve(cal, fallback)
+            if not resolved:
+                lut = None
+            else:
+                tables = [np.array([evaluate(self._pieces[c], rssi) for rssi in range(self._pieces[c][-1].end)]) for _, c in resolved]
+                length = max(len(table) for table in tables)
+                # pad with the last value, which is what clamping each table to its own end gives
+                lut = sum(w * np.pad(table, (0, length - len(table)), mode='edge') for (w, _), table in zip(resolved, tables))
+                lut = np.asarray(lut, dtype=np.float64)
+                lut.flags.writeable = False # shared between callers
+            with self._lock:
+                self._luts[key] = lut
+        return self._luts[key]
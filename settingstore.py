@@ -0,0 +1,87 @@
+'''
+IC settings loaded from a directory of files, so new settings need no code change.
+
+    <dir>/*.json  ICSetting members, ints can be hex strings ("0x12345678") and register arrays either
+                  lists or register dump strings ("00 00 30 ...")
+    <dir>/*.bin   an ICSetting as sent to the EVK (to_bytes(), the class wire layout)
+
+Each setting is serialised once when it is added and indexed by id and by the sha256 of its bytes,
+so serving one is a dict lookup.
+'''
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass
+import byteclass
+
+
+@dataclass(frozen=True)
+class StoredSetting:
+    id: int
+    hash: str # sha256 of blob
+    blob: bytes
+    setting: byteclass.ByteClass
+
+
+class SettingRepository:
+    def __init__(self, byte_class: type[byteclass.ByteClass], dir: str | None = None) -> None:
+        self.byte_class = byte_class
+        self.dir = dir
+        self._by_id: dict[int, StoredSetting] = {}
+        self._by_hash: dict[str, StoredSetting] = {}
+        self._lock = threading.Lock()
+
+    def add(self, setting: byteclass.ByteClass) -> StoredSetting:
+        blob = bytes(setting.to_bytes())
+        stored = StoredSetting(id=int(setting.id), hash=hashlib.sha256(blob).hexdigest(), blob=blob, setting=setting)
+        with self._lock:
+            old = self._by_id.get(stored.id)
+            if old is not None and old.hash != stored.hash:
+                del self._by_hash[old.hash]
+            self._by_id[stored.id] = stored
+            self._by_hash[stored.hash] = stored
+        return stored
+
+    def _read(self, path: str) -> byteclass.ByteClass:
+        if path.endswith('.bin'):
+            with open(path, 'rb') as fp:
+                return byteclass.from_bytes(self.byte_class, fp.read())
+        with open(path, 'r') as fp:
+            values = json.load(fp)
+        kwargs = {}
+        for var_name, field in byteclass.layout(self.byte_class).fields.items():
+            value = values[var_name]
+            if isinstance(value, str):
+                value = list(bytes.fromhex(value)) if field.shape else int(value, 0)
+            kwargs[var_name] = value
+        return self.byte_class(**kwargs)
+
+    def load(self) -> list[StoredSetting]:
+        '''
+        reads every setting file in dir (sorted by name, later files override earlier ones with the same id),
+        files that can't be read are skipped with an error message instead of failing the import of convert
+        '''
+        if not self.dir or not os.path.isdir(self.dir):
+            return []
+        loaded = []
+        for name in sorted(os.listdir(self.dir)):
+            if not name.endswith(('.json', '.bin')):
+                continue
+            path = os.path.join(self.dir, name)
+            try:
+                setting = self._read(path)
+            except Exception as e: # malformed json, missing members, wrong-sized .bin, ...
+                print(f'skipping IC setting file {path}: {e!r}')
+                continue
+            loaded.append(self.add(setting))
+        return loaded
+
+    def get(self, id: int) -> StoredSetting | None:
+        return self._by_id.get(id)
+
+    def get_by_hash(self, hash: str) -> StoredSetting | None:
+        return self._by_hash.get(hash)
+
+    def ids(self) -> list[int]:
+        return list(self._by_id.keys())
@@ -0,0 +1,302 @@
+import os
+import struct
+import threading
+import time
+import random
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:  # Python 3.x
+    import pickle
+
+try:
+    import fcntl
+except ImportError:  # windows, a single process per spool dir (waitress)
+    fcntl = None
+
+_FRAME = struct.Struct('<II') # length, crc32 of the pickled record
+
+
+def _try_lock(path: str):
+    '''
+    open file holding an exclusive lock on path, None when another process holds it
+    '''
+    try:
+        fp = open(path, 'ab')
+    except OSError:
+        return None
+    try:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fp
+    except OSError:
+        fp.close()
+        return None
+
+
+class Spool:
+    '''
+    Disk spool for telemetry that could not be delivered.
+
+    Records are appended to segment files (<number>.seg) as length/crc framed pickles, fsynced at
+    most every fsync_interval seconds. A replay thread sends closed segments oldest first at up to
+    replay_rate records per second, backing off (exponential with jitter) while sending fails, and
+    deletes a segment once it is drained. Progress inside a segment is kept in <number>.pos so restarts
+    resume where they stopped. When the spool holds more than max_bytes the oldest segments are dropped.
+
+    Every process (e.g. gunicorn worker) spools into its own <dir>/<pid>-<random> directory, locked with
+    owner.lock for as long as the process lives. Once a replay thread has nothing of its own left it adopts
+    directories whose lock is free (their process is gone) and segments left directly in dir by older
+    versions, so each segment is replayed by exactly one process. Without fcntl (windows) dir is used as is.
+
+    Records that fail to send are retried (at most every backoff_max seconds) for as long as the collector
+    is unreachable. Only a record that can never be delivered (send raises) is moved to <dir>/dead.letters
+    (same framing as segments) so it doesn't hold up the records behind it.
+    '''
+    def __init__(self, dir: str, segment_bytes: int = 1 << 20, max_bytes: int = 100 << 20,
+                 fsync_interval: float = 1.0, replay_rate: float = 20.0,
+                 backoff_min: float = 1.0, backoff_max: float = 60.0) -> None:
+        self.base = dir
+        self.dir = None if fcntl else dir # this process' directory, made on the first append
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes # per process
+        self.fsync_interval = fsync_interval
+        self.replay_rate = replay_rate
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.dead = 0
+        self._lock = threading.Lock()
+        self._owner_lock = None
+        self._adopted = None # (directory, lock) of an orphaned directory being replayed
+        self._file = None
+        self._file_number = None
+        self._last_fsync = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _segments(dir: str | None) -> list[int]:
+        if dir is None or not os.path.isdir(dir):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(dir) if name.endswith('.seg'))
+
+    @staticmethod
+    def _path(dir: str, number: int, ext: str = '.seg') -> str:
+        return os.path.join(dir, f'{number:08d}{ext}')
+
+    def _size(self) -> int:
+        return sum(os.path.getsize(self._path(self.dir, number)) for number in self._segments(self.dir))
+
+    def _own_dir(self) -> str:
+        # caller holds the lock
+        if self.dir is None:
+            name = f'{os.getpid()}-{os.urandom(4).hex()}'
+            tmp = os.path.join(self.base, '.' + name)
+            os.makedirs(tmp)
+            self._owner_lock = _try_lock(os.path.join(tmp, 'owner.lock'))
+            # renamed only once locked, so no other process can take it for an orphan
+            os.rename(tmp, os.path.join(self.base, name))
+            self.dir = os.path.join(self.base, name)
+        return self.dir
+
+    def _roll(self):
+        # caller holds the lock
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._file_number = None
+
+    def append(self, kind: str, json_data) -> None:
+        '''
+        kind: name of the push function that failed, passed back to the replay sender
+        '''
+        record = pickle.dumps((kind, json_data), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.base, exist_ok=True)
+                dir = self._own_dir()
+                segments = self._segments(dir)
+                self._file_number = segments[-1] + 1 if segments else 0
+                self._file = open(self._path(dir, self._file_number), 'ab')
+            self._file.write(_FRAME.pack(len(record), zlib.crc32(record)) + record)
+            self.spooled += 1
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            if self._file.tell() >= self.segment_bytes:
+                self._roll()
+                self._enforce_cap()
+
+    def _enforce_cap(self):
+        # caller holds the lock
+        segments = self._segments(self.dir)
+        while segments and self._size() > self.max_bytes:
+            number = segments.pop(0)
+            if number == self._file_number:
+                break
+            self.dropped += sum(1 for _ in self._records(self.dir, number, 0))
+            self._remove(self.dir, number)
+
+    def _remove(self, dir: str, number: int):
+        for ext in ('.seg', '.pos'):
+            try:
+                os.remove(self._path(dir, number, ext))
+            except FileNotFoundError:
+                pass
+
+    def _records(self, dir: str, number: int, offset: int):
+        with open(self._path(dir, number), 'rb') as fp:
+            fp.seek(offset)
+            while True:
+                header = fp.read(_FRAME.size)
+                if len(header) < _FRAME.size:
+                    return
+                length, crc = _FRAME.unpack(header)
+                record = fp.read(length)
+                if len(record) < length or zlib.crc32(record) != crc:
+                    return # torn write at the end of a segment
+                offset += _FRAME.size + length
+                yield offset, record
+
+    def _next_segment(self) -> tuple[str, int] | None:
+        with self._lock:
+            segments = [number for number in self._segments(self.dir) if number != self._file_number]
+            if not segments and self._file is not None and self._file.tell():
+                # nothing closed yet, close the current one so it can be replayed
+                segments = [self._file_number]
+                self._roll()
+            if segments:
+                return self.dir, segments[0]
+        return self._adopt()
+
+    def _adopt(self) -> tuple[str, int] | None:
+        '''
+        next segment of a directory whose process has exited, or of segments spooled directly in base
+        '''
+        if fcntl is None or not os.path.isdir(self.base):
+            return None
+        if self._adopted is None:
+            for name in sorted(os.listdir(self.base)):
+                dir = os.path.join(self.base, name)
+                if dir == self.dir or name.startswith('.') or not os.path.isdir(dir):
+                    continue
+                lock = _try_lock(os.path.join(dir, 'owner.lock'))
+                if lock is not None:
+                    self._adopted = (dir, lock)
+                    break
+            else:
+                if self._segments(self.base):
+                    lock = _try_lock(os.path.join(self.base, 'owner.lock'))
+                    if lock is not None:
+                        self._adopted = (self.base, lock)
+        if self._adopted is None:
+            return None
+        dir, lock = self._adopted
+        segments = self._segments(dir)
+        if segments:
+            return dir, segments[0]
+        self._adopted = None
+        self._release(dir, lock)
+        return None
+
+    def _release(self, dir: str, lock):
+        lock.close()
+        if dir == self.base:
+            return
+        try:
+            os.remove(os.path.join(dir, 'owner.lock'))
+            os.rmdir(dir)
+        except OSError:
+            pass # another process got there first, or something else was left in it
+
+    def _read_pos(self, dir: str, number: int) -> int:
+        try:
+            with open(self._path(dir, number, '.pos'), 'r') as fp:
+                return int(fp.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_pos(self, dir: str, number: int, offset: int):
+        with open(self._path(dir, number, '.pos'), 'w') as fp:
+            fp.write(str(offset))
+
+    def start(self, send) -> None:
+        '''
+        send(kind, json_data) delivers one record, called from the replay thread. It returns False for
+        failures worth retrying and raises for records that can never be delivered.
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._replay, args=(send,), name='telemetry-spool', daemon=True)
+            self._thread.start()
+
+    def _replay(self, send):
+        backoff = self.backoff_min
+        while not self._stop.is_set():
+            try:
+                backoff = self._replay_segment(send, backoff)
+            except Exception as e:
+                # e.g. a segment removed under us, keep the thread alive and try again
+                print(f"An error occurred replaying the telemetry spool: {e!r}")
+                self._stop.wait(random.uniform(0, backoff))
+                backoff = min(backoff * 2, self.backoff_max)
+
+    def _replay_segment(self, send, backoff: float) -> float:
+        segment = self._next_segment()
+        if segment is None:
+            self._stop.wait(self.backoff_min)
+            return backoff
+        dir, number = segment
+        offset = self._read_pos(dir, number)
+        drained = True
+        for next_offset, record in self._records(dir, number, offset):
+            if self._stop.is_set():
+                drained = False
+                break
+            try:
+                kind, json_data = pickle.loads(record)
+                ok = send(kind, json_data)
+            except Exception as e:
+                self._dead_letter(record, e)
+            else:
+                if not ok: # retryable, keep the record at the head until it goes through
+                    self._stop.wait(random.uniform(0, backoff)) # full jitter
+                    return min(backoff * 2, self.backoff_max)
+                self.replayed += 1
+            backoff = self.backoff_min
+            self._write_pos(dir, number, next_offset)
+            self._stop.wait(1 / self.replay_rate)
+        if drained:
+            with self._lock:
+                self._remove(dir, number)
+        return backoff
+
+    def _dead_letter(self, record: bytes, error):
+        print(f"Moving a telemetry record to {self.base}/dead.letters: {error!r}")
+        with open(os.path.join(self.base, 'dead.letters'), 'ab') as fp:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX) # shared by all processes
+            fp.write(_FRAME.pack(len(record), zlib.crc32(record)) + record)
+        with self._lock:
+            self.dead += 1
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._roll()
+            if self._owner_lock is not None and not self._segments(self.dir):
+                # nothing left to replay, don't leave an empty directory behind
+                self._release(self.dir, self._owner_lock)
+                self._owner_lock = None
+                self.dir = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._size()
+        return {'spooled': self.spooled, 'replayed': self.replayed, 'dropped': self.dropped, 'dead': self.dead, 'bytes': size}
@@ -2,8 +2,16 @@ import json
 import numpy as np
 import requests
 import base64
+import queue
+import threading
+import atexit
+import time
+import gzip
+import os
+from spool import Spool
+import rawframe
 
-url = "http://52.5.91.228:5000/stats/pushjsonv2"
+url = os.environ.get("TELEMETRY_URL", "http://52.5.91.228:5000/stats/pushjsonv2")
 
 
 class B64Encoder(json.JSONEncoder):
@@ -22,16 +30,34 @@ class NumpyTypeEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# compact separators, gzip and batches cut egress, gzip/batches need a collector that accepts them (see collector.py)
+GZIP = os.environ.get('TELEMETRY_GZIP', '0') == '1'
+GZIP_LEVEL = 6
+
+_local = threading.local()
+
+def _session() -> requests.Session:
+    # one pooled keep-alive session per sender thread
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+def _put(obj, encoder: type[json.JSONEncoder], params: dict) -> requests.Response:
+    payload = json.dumps(obj, separators=(',', ':'), cls=encoder).encode()
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    if GZIP:
+        payload = gzip.compress(payload, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+    response = _session().put(url, params=params, headers=headers, data=payload, timeout=30)
+    response.raise_for_status() # so a collector error counts as a failed push
+    return response
+
+
 def push_json(json_data):
     try:
-        payload = json.dumps({
-            "data": json_data
-        }, indent=2, cls=NumpyTypeEncoder)
-        # print(payload)
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        response = requests.request("PUT", url, headers=headers, data=payload)
+        response = _put({"data": json_data}, NumpyTypeEncoder, {})
         print(response.text)  # Comment for prod
         return True
     except Exception as e:
@@ -41,17 +67,277 @@ def push_json(json_data):
 
 def push_json_raw(json_data):
     try:
-        payload = json.dumps({
-            "data": json_data
-        }, indent=2, cls=B64Encoder)
-        # print(payload)
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        response = requests.request(
-            "PUT", f"{url}?isRaw=true", headers=headers, data=payload)
+        response = _put({"data": json_data}, B64Encoder, {'isRaw': 'true'})
         # print(response.text)  # Comment for prod
         return True
     except Exception as e:
         # print(f"An error occurred in push_json_raw: {e}")  # Comment for prod
         return False
+
+
+def push_json_batch(json_data_list: list):
+    try:
+        response = _put({"data": json_data_list}, NumpyTypeEncoder, {'batch': 'true'})
+        print(response.text)  # Comment for prod
+        return True
+    except Exception as e:
+        print(f"An error occurred in push_json_batch: {e}")  # Comment for prod
+        return False
+
+
+def push_json_raw_batch(json_data_list: list):
+    try:
+        response = _put({"data": json_data_list}, B64Encoder, {'isRaw': 'true', 'batch': 'true'})
+        return True
+    except Exception as e:
+        return False
+
+
+# 'bin' sends raw payloads with rawframe instead of base64 JSON, needs a collector that decodes it (see collector.py)
+RAW_FORMAT = os.environ.get('TELEMETRY_RAW_FORMAT', 'json')
+
+def _put_raw_bin(json_data_list, stream: bool = False) -> requests.Response:
+    headers = {
+        'Content-Type': rawframe.CONTENT_TYPE
+    }
+    body = rawframe.encode_stream(json_data_list)
+    if not stream:
+        body = b''.join(body)
+        if GZIP:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers['Content-Encoding'] = 'gzip'
+    # a generator body is sent with chunked transfer encoding
+    response = _session().put(url, params={'isRaw': 'true', 'format': 'bin'}, headers=headers, data=body, timeout=30)
+    response.raise_for_status()
+    return response
+
+
+def push_raw_bin(json_data):
+    try:
+        _put_raw_bin([json_data])
+        return True
+    except Exception as e:
+        return False
+
+
+def push_raw_bin_batch(json_data_list: list):
+    try:
+        _put_raw_bin(json_data_list)
+        return True
+    except Exception as e:
+        return False
+
+
+def push_raw_bin_stream(json_data_iter) -> bool:
+    '''
+    uploads an iterable of raw payloads as one chunked stream, records are encoded as they are consumed
+    (e.g. replaying an archive without holding it in memory)
+    '''
+    try:
+        _put_raw_bin(json_data_iter, stream=True)
+        return True
+    except Exception as e:
+        print(f"An error occurred in push_raw_bin_stream: {e}")
+        return False
+
+
+push_raw = push_raw_bin if RAW_FORMAT == 'bin' else push_json_raw
+
+BATCH_PUSH = {
+    push_json: push_json_batch,
+    push_json_raw: push_json_raw_batch,
+    push_raw_bin: push_raw_bin_batch,
+}
+
+# spooled records name their push function
+PUSH_BY_NAME = {push.__name__: push for push in (push_json, push_json_raw, push_raw_bin)}
+
+# the same sends without the catch-all, so spool replay can tell why a record failed
+SPOOL_SEND = {
+    'push_json': lambda json_data: _put({"data": json_data}, NumpyTypeEncoder, {}),
+    'push_json_raw': lambda json_data: _put({"data": json_data}, B64Encoder, {'isRaw': 'true'}),
+    'push_raw_bin': lambda json_data: _put_raw_bin([json_data]),
+}
+RETRY_STATUS = (408, 429)
+
+
+class TelemetryQueue:
+    '''
+    Bounded queue drained by background sender threads, keeps push_json/push_json_raw off the request path.
+
+    submit never blocks, when the queue is full the item is dropped and counted.
+    Pending items are flushed at exit (up to close_timeout seconds).
+
+    With batch_size > 1 a sender collects up to batch_size items (waiting at most batch_interval seconds
+    after the first one) and uploads items of the same kind in one request through BATCH_PUSH.
+
+    With a spool, items that fail to send or don't fit in the queue are written to disk instead of
+    being lost, and replayed by the spool when the collector is reachable again.
+    '''
+    def __init__(self, workers: int = 2, maxsize: int = 1000, close_timeout: float = 10.0,
+                 batch_size: int = 1, batch_interval: float = 1.0, spool: Spool | None = None) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.close_timeout = close_timeout
+        self.queue = queue.Queue(maxsize)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spooled = 0
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+        self.spool = spool
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'telemetry-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.spool is not None:
+                self.spool.start(self._spool_send)
+            atexit.register(self.close)
+
+    @staticmethod
+    def _spool_send(kind: str, json_data) -> bool:
+        '''
+        False when retrying can help (collector unreachable, 5xx, 408/429), raises for records the collector
+        will never take (other 4xx, payloads that can't be encoded) so the spool dead-letters them
+        '''
+        try:
+            SPOOL_SEND[kind](json_data)
+            return True
+        except (requests.ConnectionError, requests.Timeout):
+            return False
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 500
+            if status < 500 and status not in RETRY_STATUS:
+                raise
+            return False
+
+    def _spool_append(self, push, json_data) -> bool:
+        if self.spool is None or push.__name__ not in PUSH_BY_NAME:
+            return False
+        try:
+            self.spool.append(push.__name__, json_data)
+            return True
+        except Exception as e:
+            print(f"An error occurred spooling telemetry: {e}")
+            return False
+
+    def _collect(self, first) -> tuple[list, bool]:
+        items = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _send(self, items: list):
+        groups: dict = {}
+        for push, json_data in items:
+            groups.setdefault(push, []).append(json_data)
+        for push, json_data_list in groups.items():
+            try:
+                if len(json_data_list) > 1 and push in BATCH_PUSH:
+                    results = [BATCH_PUSH[push](json_data_list)] * len(json_data_list)
+                else:
+                    results = [push(json_data) for json_data in json_data_list]
+            except Exception:
+                results = [False] * len(json_data_list)
+            spooled = 0
+            for ok, json_data in zip(results, json_data_list):
+                if not ok:
+                    spooled += self._spool_append(push, json_data)
+            with self._lock:
+                self.sent += sum(results)
+                self.failed += len(results) - sum(results)
+                self.spooled += spooled
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            items, stop = self._collect(item) if self.batch_size > 1 else ([item], False)
+            self._send(items)
+            for _ in range(len(items) + stop):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def submit(self, push, json_data) -> bool:
+        '''
+        push: push_json or push_json_raw, called with json_data on a sender thread
+        '''
+        if self._closed:
+            return False
+        self._start()
+        try:
+            self.queue.put_nowait((push, json_data))
+            return True
+        except queue.Full:
+            spooled = self._spool_append(push, json_data)
+            with self._lock:
+                self.spooled += spooled
+                self.dropped += not spooled
+            return spooled
+
+    def flush(self, timeout: float | None = None) -> bool:
+        '''
+        waits until everything submitted so far has been sent (or failed), False on timeout
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush(self.close_timeout)
+        for _ in self._threads:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break # senders still busy after the timeout, they are daemon threads
+        for thread in self._threads:
+            thread.join(0.1)
+        if self.spool is not None:
+            self.spool.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {'queued': self.queue.qsize(), 'sent': self.sent, 'failed': self.failed, 'dropped': self.dropped, 'spooled': self.spooled}
+        if self.spool is not None:
+            stats['spool'] = self.spool.stats()
+        return stats
+
+
+telemetry = TelemetryQueue(
+    maxsize=int(os.environ.get('TELEMETRY_QUEUE_MAX', 1000)),
+    batch_size=int(os.environ.get('TELEMETRY_BATCH_SIZE', 1)),
+    batch_interval=float(os.environ.get('TELEMETRY_BATCH_INTERVAL', 1.0)),
+    spool=Spool(
+        os.environ.get('TELEMETRY_SPOOL_DIR', 'telemetry_spool'),
+        max_bytes=int(os.environ.get('TELEMETRY_SPOOL_MAX_BYTES', 100 << 20)),
+    ),
+)